@@ -1,19 +1,103 @@
-import requests
+"""
+Telegram alerts, dispatched in background so requests never wait for Telegram.
+
+`telegram()` only puts message into a bounded queue. A worker task drains it,
+collapses a burst of identical messages into one (with a count), sends at most
+`TELEGRAM_BATCH_MAX` distinct ones per burst (most frequent first, the rest as
+one "N more alerts suppressed") and keeps a minimal interval between sends.
+Leftovers are flushed on shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import Counter
+
 import structlog
 
+import crud.http
 from config import settings
 
 log = structlog.get_logger()
 
+_queue: asyncio.Queue[str] | None = None
+_worker: asyncio.Task | None = None
+_pending: Counter[str] = Counter()  # batch being dispatched right now
+_dropped = 0
+
+
+def queue() -> asyncio.Queue[str]:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=settings.TELEGRAM_QUEUE_SIZE)
+    return _queue
+
+
+def start() -> None:
+    """Start dispatcher worker in running loop (no-op if running already)."""
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_dispatch())
+
 
 async def telegram(text: str) -> None:
     if not settings.TELEGRAM_ENABLED:
         return None
 
+    global _dropped
+    start()
+    try:
+        queue().put_nowait(text)
+    except asyncio.QueueFull:
+        _dropped += 1
+        if _dropped == 1:  # dont flood logs, count goes with next message
+            log.warning("telegram queue full, dropping messages", message=text)
+    return None
+
+
+async def _dispatch() -> None:
+    q = queue()
+    loop = asyncio.get_running_loop()
+    while True:
+        _pending[await q.get()] += 1
+
+        # collect the rest of a burst
+        deadline = loop.time() + settings.TELEGRAM_BATCH_S
+        while (timeout := deadline - loop.time()) > 0:
+            try:
+                _pending[await asyncio.wait_for(q.get(), timeout)] += 1
+            except asyncio.TimeoutError:
+                break
+
+        await _send_pending()
+
+
+async def _send_pending() -> None:
+    global _dropped
+    sent = 0
+    while _pending:
+        if sent >= settings.TELEGRAM_BATCH_MAX:
+            n = sum(_pending.values())
+            _pending.clear()
+            text = f"<i>{n} more alerts suppressed</i>"
+        else:
+            text, n = _pending.most_common(1)[0]
+            del _pending[text]
+            if n > 1:
+                text += f"\n\n<i>{n}x</i>"
+        if _dropped:
+            text += f"\n<i>+{_dropped} dropped</i>"
+            _dropped = 0
+        await _send(text)
+        sent += 1
+        await asyncio.sleep(settings.TELEGRAM_MIN_INTERVAL_S)  # rate limit
+
+
+async def _send(text: str) -> None:
     api_url = "https://api.telegram.org"
     endpoint = "sendMessage"
     try:
-        requests.post(
+        await crud.http.client().post(
             url=f"{api_url}/bot{settings.TELEGRAM_BOT_TOKEN}/{endpoint}",
             headers={"Content-type": "application/json"},
             params={
@@ -21,7 +105,26 @@ async def telegram(text: str) -> None:
                 "text": text,
                 "parse_mode": "HTML",
             },
+            timeout=settings.TELEGRAM_TIMEOUT_S,
         )
-    except BaseException:
+    except Exception:
         log.warning("telegram message not dispatched", message=text)
-    return None
+
+
+async def flush() -> None:
+    """Stop worker and send whatever is left (on shutdown)."""
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _worker
+        _worker = None
+
+    if _queue is not None:
+        while not _queue.empty():
+            _pending[_queue.get_nowait()] += 1
+
+    try:
+        await asyncio.wait_for(_send_pending(), settings.TELEGRAM_FLUSH_S)
+    except asyncio.TimeoutError:
+        log.warning("telegram flush timed out", left=sum(_pending.values()))
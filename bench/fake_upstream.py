@@ -0,0 +1,126 @@
+"""
+Fake upstreams (ECB, apilayer, investing.com) for load tests, no real calls, no quota.
+
+    uvicorn bench.fake_upstream:app --port 9000
+
+and point the app to it:
+
+    ECB_ENDPOINT=http://localhost:9000/ecb/
+    APILAYER_ENDPOINT=http://localhost:9000/apilayer/
+    INVESTINY_ENDPOINT=http://localhost:9000/investiny/
+
+Latency, errors and rate limits are set by FAKE_* env vars (see `FakeSettings`).
+Payloads are synthetic, same shape as real ones (see `bench.payloads`).
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime as dt
+import random
+import time
+
+from fastapi import FastAPI
+from fastapi import Header
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseSettings
+
+from bench import payloads
+
+
+class FakeSettings(BaseSettings):
+    LATENCY_MS: float = 100  # mean response time
+    JITTER_MS: float = 50  # +- uniformly around mean
+    ERROR_RATE: float = 0.0  # share of 500 responses, 0..1
+    RATE_LIMIT_PER_S: int = 0  # per source, over it -> 429, 0 = no limit
+    APILAYER_QUOTA: int = 1_000_000  # monthly calls, then 429 like real apilayer
+
+    class Config:
+        env_prefix = "FAKE_"
+
+
+fake_settings = FakeSettings()
+app = FastAPI(title="fake upstreams")
+
+_calls: dict[str, collections.deque[float]] = collections.defaultdict(collections.deque)
+_apilayer_used = 0
+
+
+async def _behave(source: str) -> Response | None:
+    """Sleep like a real server, maybe fail. Returns error response, if any."""
+    delay = fake_settings.LATENCY_MS + random.uniform(
+        -fake_settings.JITTER_MS, fake_settings.JITTER_MS
+    )
+    await asyncio.sleep(max(delay, 0) / 1000)
+
+    if fake_settings.RATE_LIMIT_PER_S:
+        now = time.monotonic()
+        calls = _calls[source]
+        while calls and calls[0] <= now - 1:
+            calls.popleft()
+        if len(calls) >= fake_settings.RATE_LIMIT_PER_S:
+            return JSONResponse({"message": "rate limit"}, status_code=429)
+        calls.append(now)
+
+    if random.random() < fake_settings.ERROR_RATE:
+        return JSONResponse({"message": "fake error"}, status_code=500)
+    return None
+
+
+@app.get("/ecb/{key}")
+async def ecb(key: str, startPeriod: str, endPeriod: str) -> Response:
+    if error := await _behave("ecb"):
+        return error
+    # "D+M.USD+CZK.EUR.SP00.A"
+    freqs, symbols, *_ = key.split(".")
+    csv = payloads.ecb_csv(symbols.split("+"), startPeriod, endPeriod)
+    if "M" not in freqs.split("+"):
+        csv = b"\n".join(x for x in csv.split(b"\n") if not x.startswith(b"EXR.M"))
+    if csv.count(b"\n") <= 1:
+        # real ECB says 404 when there are no observations (eg. weekend only)
+        return Response("No results found.", status_code=404)
+    return Response(csv, media_type="text/csv")
+
+
+@app.get("/apilayer/timeseries")
+async def apilayer(
+    start_date: str,
+    end_date: str,
+    symbols: str,
+    apikey: str = Header(""),
+) -> Response:
+    global _apilayer_used
+    if not apikey:
+        return JSONResponse({"message": "No API key found in request"}, 401)
+    if error := await _behave("apilayer"):
+        return error
+
+    remaining = fake_settings.APILAYER_QUOTA - _apilayer_used
+    headers = {
+        "X-RateLimit-Limit-Month": str(fake_settings.APILAYER_QUOTA),
+        "X-RateLimit-Remaining-Month": str(max(remaining - 1, 0)),
+    }
+    if remaining <= 0:
+        return JSONResponse(
+            {"message": "You have exceeded your monthly quota"}, 429, headers
+        )
+    _apilayer_used += 1
+    return Response(
+        payloads.apilayer_json(symbols.split(","), start_date, end_date),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@app.get("/investiny/{_id}/0/0/0/0/history")
+async def investiny(request: Request, symbol: int) -> Response:
+    if error := await _behave("investiny"):
+        return error
+    # same (local time) conversion as in `crud.fx.investiny_historical_data`
+    date_from, date_to = (
+        dt.datetime.fromtimestamp(int(request.query_params[x])).date().isoformat()
+        for x in ("from", "to")
+    )
+    return JSONResponse(payloads.investiny_raw(str(symbol), date_from, date_to))
@@ -0,0 +1,156 @@
+"""
+Load generator for the full user flow: submit form -> fetch + transform + Excel -> download.
+
+    python -m bench.load --url http://localhost:8000 --concurrency 8 --requests 200
+
+Run the app against fake upstreams (see `bench.fake_upstream`), not the real ones.
+Every flow picks a random month range within last `--months-back` months, so there
+is a mix of cache hits and upstream fetches. Reports throughput, latency
+percentiles and error rate of whole flows.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from bench import payloads
+
+LINK = re.compile(r'href="([^"]+)"')
+POLL = re.compile(r'hx-get="([^"]+)"')
+POLL_S = 0.25  # browser polls every 1 s, we want finer latency
+
+
+def form(months_back: int, max_months: int, sources: list[str]) -> dict[str, str]:
+    date_from, date_to = payloads.span(months_back)
+    months = payloads.month_list(date_from, date_to)
+    # app wants date_from month before date_to month
+    start = random.randrange(len(months) - 1)
+    end = min(start + 1 + random.randrange(max_months), len(months) - 1)
+    return {"date_from": months[start], "date_to": months[end]} | {
+        s: "on" for s in sources
+    }
+
+
+async def flow(client: httpx.AsyncClient, data: dict[str, str]) -> None:
+    """One user: submit, then download the workbook from result link."""
+    response = await client.post("/fx/", data=data)
+    # export job: poll it (like htmx does) until there is a link
+    while not response.is_error and (poll := POLL.search(response.text)):
+        await asyncio.sleep(POLL_S)
+        response = await client.get(poll.group(1))
+    if response.is_error:
+        raise ValueError(f"submit {response.status_code} {response.text[:100]}")
+    if not (link := LINK.search(response.text)):
+        raise ValueError(f"no download link in result {response.text.strip()[:100]}")
+    download = await client.get(link.group(1))
+    if download.is_error:
+        raise ValueError(f"download {download.status_code}")
+    if not download.content.startswith(b"PK"):  # xlsx = zip
+        raise ValueError("download is not a workbook")
+
+
+async def worker(
+    args: argparse.Namespace,
+    queue: asyncio.Queue[int],
+    latencies: list[float],
+    errors: list[str],
+) -> None:
+    """One user (own session cookie), doing flows one after another."""
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, follow_redirects=True
+    ) as client:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            data = form(args.months_back, args.max_months, args.sources)
+            t0 = time.perf_counter()
+            try:
+                await flow(client, data)
+            except (httpx.HTTPError, ValueError) as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            else:
+                latencies.append(time.perf_counter() - t0)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(p) - 1]
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    t0 = time.perf_counter()
+    await asyncio.gather(
+        *(worker(args, queue, latencies, errors) for _ in range(args.concurrency))
+    )
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seconds": elapsed,
+        "throughput_per_s": len(latencies) / elapsed,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "error_rate": len(errors) / args.requests,
+        "errors": sorted(set(errors))[:10],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--months-back", type=int, default=36)
+    parser.add_argument("--max-months", type=int, default=12, help="range length")
+    parser.add_argument(
+        "--sources",
+        type=lambda s: s.split(","),
+        default=["ecb", "apilayer", "investiny"],
+    )
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(
+        f":: {result['requests']} flows, concurrency {result['concurrency']}, "
+        f"{result['seconds']:.1f} s"
+    )
+    print(f":: throughput {result['throughput_per_s']:.2f} flows/s")
+    print(
+        ":: latency p50 {p50_s:.3f} s, p95 {p95_s:.3f} s, p99 {p99_s:.3f} s".format(
+            **result
+        )
+    )
+    print(f":: error rate {result['error_rate']:.1%}")
+    for e in result["errors"]:
+        print(f"   {e}")
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
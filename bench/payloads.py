@@ -0,0 +1,123 @@
+"""
+Upstream payloads for offline runs, in the same shape upstreams send them.
+
+Synthetic ones scale from 1 month to years and from a few currencies to hundreds.
+Recorded ones are real payloads kept by `audit` (CACHE_RAW_PAYLOADS=1), exported
+into bench/recorded/ by `python -m bench.record`.
+"""
+from __future__ import annotations
+
+import csv
+import datetime as dt
+import io
+import itertools
+import json
+import string
+from collections.abc import Iterator
+from pathlib import Path
+
+RECORDED = Path(__file__).parent / "recorded"
+
+ECB_HEADER = [
+    "KEY",
+    "FREQ",
+    "CURRENCY",
+    "CURRENCY_DENOM",
+    "EXR_TYPE",
+    "EXR_SUFFIX",
+    "TIME_PERIOD",
+    "OBS_VALUE",
+]
+
+
+def currencies(n: int) -> list[str]:
+    """`n` distinct 3-letter codes, deterministic."""
+    letters = string.ascii_uppercase
+    return [
+        "".join(x) for x in itertools.islice(itertools.product(letters, repeat=3), n)
+    ]
+
+
+def span(months: int, end: str = "2022-09-30") -> tuple[str, str]:
+    """(date_from, date_to) covering `months` full months up to `end`."""
+    to = dt.date.fromisoformat(end)
+    y, m = divmod(to.year * 12 + to.month - 1 - (months - 1), 12)
+    return dt.date(y, m + 1, 1).isoformat(), to.isoformat()
+
+
+def days(date_from: str, date_to: str) -> Iterator[dt.date]:
+    d = dt.date.fromisoformat(date_from)
+    while d <= dt.date.fromisoformat(date_to):
+        yield d
+        d += dt.timedelta(days=1)
+
+
+def month_list(date_from: str, date_to: str) -> list[str]:
+    return sorted({d.strftime("%Y-%m") for d in days(date_from, date_to)})
+
+
+def _value(currency: str, i: int) -> float:
+    # some deterministic wiggle, magnitude differs per currency
+    return round((1 + sum(map(ord, currency)) % 50) * (1 + (i % 37) / 1000), 6)
+
+
+def ecb_csv(symbols: list[str], date_from: str, date_to: str) -> bytes:
+    """ECB SDMX csv (daily on business days + monthly averages)."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(ECB_HEADER)
+    for c in symbols:
+        monthly: dict[str, list[float]] = {}
+        for i, d in enumerate(days(date_from, date_to)):
+            if d.weekday() < 5:
+                value = _value(c, i)
+                monthly.setdefault(d.strftime("%Y-%m"), []).append(value)
+                w.writerow(
+                    [f"EXR.D.{c}.EUR.SP00.A", "D", c, "EUR", "SP00", "A"]
+                    + [d.isoformat(), value]
+                )
+        for m, values in monthly.items():
+            # like real ECB: average of daily
+            value = round(sum(values) / len(values), 6)
+            w.writerow([f"EXR.M.{c}.EUR.SP00.A", "M", c, "EUR", "SP00", "A", m, value])
+    return buf.getvalue().encode()
+
+
+def apilayer_json(symbols: list[str], date_from: str, date_to: str) -> bytes:
+    """Apilayer `timeseries` response (every calendar day)."""
+    rates = {
+        d.isoformat(): {c: _value(c, i) for c in symbols}
+        for i, d in enumerate(days(date_from, date_to))
+    }
+    return json.dumps(
+        {
+            "success": True,
+            "timeseries": True,
+            "start_date": date_from,
+            "end_date": date_to,
+            "base": "EUR",
+            "rates": rates,
+        }
+    ).encode()
+
+
+def investiny_raw(currency: str, date_from: str, date_to: str) -> dict[str, object]:
+    """Raw investing.com monthly `history` response (values only, no dates)."""
+    n = len(month_list(date_from, date_to))
+    close = [_value(currency, i) for i in range(n)]
+    return {"s": "ok", "o": close, "h": close, "l": close, "c": close}
+
+
+def investiny_history(currency: str, date_from: str, date_to: str) -> dict[str, list]:
+    """What `crud.fx.investiny_historical_data` makes of `investiny_raw`."""
+    data = investiny_raw(currency, date_from, date_to)
+    return {"open": data["o"], "high": data["h"], "low": data["l"], "close": data["c"]}
+
+
+def recorded() -> dict[str, list[Path]]:
+    """Recorded payload files per source (bench/recorded/<source>/...)."""
+    return {
+        source: sorted((RECORDED / source).glob("*"))
+        for source in ("ecb", "apilayer", "investiny")
+        if (RECORDED / source).is_dir()
+    }
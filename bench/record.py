@@ -0,0 +1,57 @@
+"""
+Export raw upstream payloads kept in cache into bench/recorded/, for offline runs.
+
+Payloads are kept only with CACHE_RAW_PAYLOADS=1, so run the app with it for a
+while (or warm the cache), then:
+
+    python -m bench.record
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+
+import structlog
+
+import crud.cache
+from bench.payloads import RECORDED
+
+log = structlog.get_logger()
+
+SUFFIX = {"ecb": ".csv", "apilayer": ".json", "investiny": ".json"}
+MAX_SYMBOLS_LEN = 120  # file names have 255 at most
+
+
+def symbols(what: list[str]) -> str:
+    """Symbol set for file name, long ones shortened (+ hash, still unique)."""
+    name = "-".join(what)
+    if len(name) <= MAX_SYMBOLS_LEN:
+        return name
+    digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+    return f"{name[:MAX_SYMBOLS_LEN - 9]}-{digest}"
+
+
+def main() -> None:
+    conn = crud.cache.connect()
+    keys = [
+        k
+        for (k,) in conn.execute("""SELECT key FROM cache WHERE key LIKE '["raw",%'""")
+    ]
+    for key in keys:
+        _, source, what, span_from, span_to = json.loads(key)
+        payload = crud.cache.get(key)
+        if payload is None or source not in SUFFIX:
+            continue
+        if source == "investiny":
+            name = f"{what}_{span_from}_{span_to}{SUFFIX[source]}"  # investing.com id
+            payload = json.dumps(payload).encode()
+        else:
+            name = f"{symbols(what)}_{span_from}_{span_to}{SUFFIX[source]}"
+        path = RECORDED / source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(payload)
+        log.info("payload recorded", path=str(path), size=len(payload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Offline benchmarks of the data pipeline, stage by stage.
+
+    python -m bench.run                          # default matrix
+    python -m bench.run --months 1,12 --currencies 8,50
+    python -m bench.run --recorded               # + payloads from bench/recorded/
+    python -m bench.run --baseline bench/results/<old>.json --threshold 0.25
+
+Stages: parsing of each upstream payload (ecb, apilayer, investiny), `transform`
+and the Excel workbook. Every stage gets time (best of a few runs) and peak
+memory (tracemalloc, separate run). Results go to bench/results/ as JSON; with
+`--baseline` it exits 1 when any stage got slower (or hungrier) than threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import functools
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+import crud.fx
+import fx.export
+import fx.forms
+from bench import payloads
+from config import settings
+
+RESULTS = Path(__file__).parent / "results"
+STAGES = ("ecb", "apilayer", "investiny", "transform", "excel")
+EXCEL_MAX_ROWS = 1_048_575  # sheet limit, minus header
+NOISE_S = 0.002  # differences below this are not regressions
+
+
+def measure(fn: Callable[[], Any], repeat: int, budget_s: float) -> dict[str, float]:
+    """Best time of up to `repeat` runs (stops early after `budget_s`) + peak memory."""
+    times: list[float] = []
+    while len(times) < repeat and sum(times) < budget_s:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "runs": len(times), "peak_bytes": peak}
+
+
+def case(
+    months: int, n: int, stages: list[str], repeat: int, budget_s: float
+) -> list[dict[str, Any]]:
+    """All `stages` for synthetic data of `months` x `n` currencies."""
+    date_from, date_to = payloads.span(months)
+    currencies = payloads.currencies(n)
+    ecb = payloads.ecb_csv(currencies, date_from, date_to)
+    apilayer = payloads.apilayer_json(currencies, date_from, date_to)
+    investiny = {
+        c: payloads.investiny_history(c, date_from, date_to) for c in currencies
+    }
+
+    def parse_investiny() -> pd.DataFrame:
+        return pd.concat(
+            [
+                crud.fx.parse_investiny(dic, c, date_from, date_to)
+                for c, dic in investiny.items()
+            ]
+        )
+
+    df = pd.concat(
+        [crud.fx.parse_ecb(ecb), crud.fx.parse_apilayer(apilayer), parse_investiny()]
+    )
+    daily, spot, monthly = fx.forms.transform(df)
+
+    def excel() -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            fx.export.write_xlsx(Path(tmp) / "bench.xlsx", daily, spot, monthly)
+
+    fns: dict[str, tuple[Callable[[], Any], int]] = {
+        "ecb": (lambda: crud.fx.parse_ecb(ecb), len(ecb)),
+        "apilayer": (lambda: crud.fx.parse_apilayer(apilayer), len(apilayer)),
+        "investiny": (parse_investiny, n),
+        "transform": (lambda: fx.forms.transform(df), len(df)),
+        "excel": (excel, len(daily) + len(spot) + len(monthly)),
+    }
+
+    out = []
+    for stage in stages:
+        fn, size = fns[stage]
+        result: dict[str, Any] = {
+            "stage": stage,
+            "months": months,
+            "currencies": n,
+            "size": size,  # payload bytes, symbols or rows
+        }
+        if stage == "excel" and len(daily) > EXCEL_MAX_ROWS:
+            result["skipped"] = "daily rows over Excel sheet limit"
+        else:
+            result |= measure(fn, repeat, budget_s)
+        out.append(result)
+        print(f":: {_fmt(result)}")
+    return out
+
+
+def _parser(source: str, raw: bytes, name: str) -> Callable[[], pd.DataFrame]:
+    """Parse function for a recorded payload file `name` (see `bench.record`)."""
+    if source == "ecb":
+        return functools.partial(crud.fx.parse_ecb, raw)
+    if source == "apilayer":
+        return functools.partial(crud.fx.parse_apilayer, raw)
+    id_, date_from, date_to = name.split("_")
+    currency = {
+        str(v): k.split("/")[1] for k, v in settings.INVESTINY_SYMBOLS.items()
+    }.get(id_, id_)
+    return functools.partial(
+        crud.fx.parse_investiny, json.loads(raw), currency, date_from, date_to
+    )
+
+
+def recorded(repeat: int, budget_s: float) -> list[dict[str, Any]]:
+    """Parsing stages on recorded payloads (bench/recorded/, see `bench.record`)."""
+    out = []
+    for source, paths in payloads.recorded().items():
+        for path in paths:
+            raw = path.read_bytes()
+            fn = _parser(source, raw, path.stem)
+            date_from, date_to = path.stem.split("_")[-2:]
+            result = {
+                "stage": source,
+                "months": len(payloads.month_list(date_from, date_to)),
+                "currencies": fn()["currency"].nunique(),
+                "size": len(raw),
+                "fixture": path.name,
+            } | measure(fn, repeat, budget_s)
+            out.append(result)
+            print(f":: {_fmt(result)}  ({path.name})")
+    return out
+
+
+def _fmt(r: dict[str, Any]) -> str:
+    what = f"{r['stage']:<10} {r['months']:>4} mon {r['currencies']:>4} cur"
+    if "skipped" in r:
+        return f"{what}   skipped: {r['skipped']}"
+    return f"{what} {r['seconds'] * 1000:>10.1f} ms {r['peak_bytes'] / 2**20:>9.1f} MiB"
+
+
+def _key(r: dict[str, Any]) -> tuple[str, int, int, str]:
+    return r["stage"], r["months"], r["currencies"], r.get("fixture", "")
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """Human readable regressions against `baseline` (empty = all good)."""
+    old = {_key(r): r for r in baseline if "skipped" not in r}
+    bad = []
+    for r in results:
+        if "skipped" in r or (b := old.get(_key(r))) is None:
+            continue
+        slower = r["seconds"] > b["seconds"] * (1 + threshold)
+        if slower and r["seconds"] - b["seconds"] > NOISE_S:
+            bad.append(f"{_fmt(r)}  time x{r['seconds'] / b['seconds']:.2f}")
+        if r["peak_bytes"] > b["peak_bytes"] * (1 + threshold):
+            bad.append(f"{_fmt(r)}  memory x{r['peak_bytes'] / b['peak_bytes']:.2f}")
+    return bad
+
+
+def meta() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "ts": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def _ints(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--months", type=_ints, default=[1, 12, 120])
+    parser.add_argument("--currencies", type=_ints, default=[8, 200])
+    parser.add_argument("--stages", type=lambda s: s.split(","), default=STAGES)
+    parser.add_argument(
+        "--recorded", action="store_true", help="also parse recorded payloads"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds per stage")
+    parser.add_argument("--out", type=Path, help="default bench/results/<ts>.json")
+    parser.add_argument("--baseline", type=Path, help="results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    if unknown := set(args.stages) - set(STAGES):
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = []
+    for months in args.months:
+        for n in args.currencies:
+            results += case(months, n, args.stages, args.repeat, args.budget)
+    if args.recorded:
+        results += recorded(args.repeat, args.budget)
+
+    run = {"meta": meta(), "results": results}
+    out = args.out or RESULTS / f"{dt.datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(run, indent=2))
+    print(f":: results in {out}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        if bad := compare(results, baseline, args.threshold):
+            print(f":: regressions over {args.threshold:.0%}:")
+            for line in bad:
+                print(f"   {line}")
+            return 1
+        print(f":: no regressions over {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
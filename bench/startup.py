@@ -0,0 +1,106 @@
+"""
+Startup time report: what `import main` costs (`-X importtime`) and how long it
+takes from process start to the first served request.
+
+    python -m bench.startup
+    python -m bench.startup --runs 5 --top 20 --out startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+HEAVY = ("pandas", "numpy", "pendulum", "openpyxl", "investiny")
+
+
+def importtime(top: int) -> dict[str, Any]:
+    """Parse `python -X importtime -c "import main"` output."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    imported = {name for name, _, _ in rows}
+    return {
+        "import_main_s": next(c for n, _, c in rows if n == "main") / 1e6,
+        "heavy_imported": [m for m in HEAVY if m in imported],
+        "top_self_s": [
+            {"module": name, "self_s": s / 1e6, "cumulative_s": c / 1e6}
+            for name, s, c in sorted(rows, key=lambda x: -x[1])[:top]
+        ],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_request(timeout: float = 30) -> float:
+    """Seconds from spawning uvicorn to first 200 on `/`."""
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=os.environ | {"WARM_ENABLED": "0"},
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).is_success:
+                    return time.perf_counter() - t0
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError("app did not start")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    report = importtime(args.top)
+    report["first_request_s"] = statistics.median(
+        first_request() for _ in range(args.runs)
+    )
+
+    print(f":: import main           {report['import_main_s']:.3f} s")
+    print(f":: start -> first /      {report['first_request_s']:.3f} s")
+    print(f":: heavy deps on import  {', '.join(report['heavy_imported']) or '-'}")
+    print(":: slowest modules (self time):")
+    for row in report["top_self_s"]:
+        print(f"   {row['self_s'] * 1000:>8.1f} ms  {row['module']}")
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
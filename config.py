@@ -1,6 +1,7 @@
 import functools
 import random
 import string
+from typing import Literal
 
 import structlog
 from pydantic import BaseSettings
@@ -34,15 +35,93 @@ class Settings(BaseSettings):
     TELEGRAM_ENABLED: bool = False
     TELEGRAM_BOT_TOKEN: str | None = None
     TELEGRAM_CHAT_ID: str | None = None
+    TELEGRAM_TIMEOUT_S: float = 10
+    TELEGRAM_QUEUE_SIZE: int = 100  # more pending messages get dropped
+    TELEGRAM_BATCH_S: float = 2  # identical messages within this window -> one
+    TELEGRAM_BATCH_MAX: int = 5  # distinct messages sent per batch, rest -> one
+    TELEGRAM_MIN_INTERVAL_S: float = 1  # between two messages sent
+    TELEGRAM_FLUSH_S: float = 5  # max time to send leftovers on shutdown
 
     BASE: str = "EUR"
 
+    CACHE_BACKEND: Literal["sqlite", "shelve"] = "sqlite"
+    # LRU eviction of key-value entries above this, 0 = no limit (not observations)
+    CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    CACHE_TTL_OPEN_S: int = 60 * 60  # data for current month may still change
+    CACHE_GRACE_DAYS: int = 3  # month is "closed" this many days after its end
+    CACHE_RAW_PAYLOADS: bool = False  # keep raw upstream responses for audit
+    # compression of key-value entries (raw payloads), not of observations
+    CACHE_CODEC: Literal["none", "zlib", "lzma", "zstd"] = "zlib"  # zstd: -E zstd
+    CACHE_COMPRESS_MIN_BYTES: int = 512  # smaller values are stored as they are
+    STORE_L1_MAX_BYTES: int = 64 * 1024 * 1024  # hot DFs in memory per worker, 0 = off
+
     ECB_ENDPOINT: str = "https://sdw-wsrest.ecb.europa.eu/service/data/EXR/"
     ECB_SYMBOLS: str = "USD+CZK+HUF+RON+TRY+BGN+HRK+GBP"  # we can get monthly too
 
     APILAYER_API_KEY: SecretStr
     APILAYER_ENDPOINT: str = "https://api.apilayer.com/exchangerates_data/"
     APILAYER_SYMBOLS: str = "RSD,KZT,UAH,UZS"  # daily only
+    QUOTA_REFRESH_S: int = 60  # re-read quota written by other workers
+
+    # investing.com (investiny) API, ID is random in URL
+    INVESTINY_ENDPOINT: str = "https://tvc4.investing.com/"
+
+    HTTP_TIMEOUT_S: float = 30
+    # max concurrent upstream calls per source
+    HTTP_CONCURRENCY: dict = {"ecb": 4, "apilayer": 2, "investiny": 4}
+    # upstream policy: timeouts, retries (jittered exponential backoff), breaker
+    HTTP_CONNECT_TIMEOUT_S: float = 5
+    HTTP_READ_TIMEOUT_S: dict = {"ecb": 30, "apilayer": 30, "investiny": 15}
+    HTTP_RETRIES: int = 2  # extra attempts on timeouts, 429 and 5xx
+    HTTP_BACKOFF_S: float = 0.5  # first retry waits up to this, doubles after
+    HTTP_BACKOFF_MAX_S: float = 5
+    BREAKER_FAILURES: int = 5  # failed calls in a row -> stop calling upstream
+    BREAKER_RESET_S: float = 60  # then try again after this long
+
+    # exported files in tmp/
+    ARTIFACTS_MAX_BYTES: int = 512 * 1024 * 1024
+    ARTIFACTS_MAX_AGE_S: int = 7 * 24 * 60 * 60
+
+    # export jobs: form submit returns at once, browser polls for the result
+    JOBS_WORKERS: int = 2  # jobs running at once (per worker process), rest waits
+    JOBS_PER_USER: int = 2  # queued + running per user (session)
+    JOBS_TTL_S: int = 60 * 60  # finished jobs are forgotten after
+
+    # batch export (/fx/batch/)
+    BATCH_MAX_SPECS: int = 50  # workbooks per batch
+    BATCH_PROCESSES: int = 0  # transform + Excel processes per worker, 0 = all cores
+
+    METRICS_FLUSH_S: int = 10  # how often worker shares its metrics with others
+
+    # monthly averages computed from daily (crud.monthly), not fetched
+    MONTHLY_DERIVE: bool = True
+    MONTHLY_VERIFY: bool = False  # fetch ECB monthly too and compare with ours
+    MONTHLY_TOLERANCE: float = 0.001  # relative, bigger difference is logged
+
+    # provider router (crud.router), when more sources can give the same rates
+    ROUTER_PRIORITY: str = "ecb,investiny,apilayer"  # owner of shared (currency, freq)
+    # expected call latency, until measured
+    ROUTER_LATENCY_S: dict = {
+        "ecb": 0.5,
+        "apilayer": 1,
+        "investiny": 2,
+    }
+    # apilayer call "costs" this much, more as quota drains
+    ROUTER_QUOTA_COST_S: float = 5
+    # below this, apilayer only for what others dont have
+    ROUTER_APILAYER_RESERVE: int = 20
+
+    # cross rates (eg. "USD/CZK,GBP/HUF") prefilled in form, derived from BASE rates
+    CROSS_PAIRS: str = ""
+    CROSS_SOURCE_PRIORITY: str = "ecb,apilayer,investiny"  # which source wins a leg
+
+    # cache warming, prefetch current + previous month (ECB publishes ~16:00 CET)
+    WARM_ENABLED: bool = False
+    WARM_TIMES: str = "15:30"  # UTC, comma separated
+    WARM_SOURCES: str = "ecb,apilayer,investiny"
+    WARM_APILAYER_MIN_QUOTA: int = 50  # dont warm apilayer below this remaining
+    # import pandas & co in background right after startup (else on first use)
+    WARM_IMPORTS: bool = False
 
     # Might be problematic to change via env var x))) But I dont care, as it involves
     # getting investing IDs so its kinda "advanced" to set it up.
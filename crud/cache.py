@@ -1,19 +1,281 @@
 from __future__ import annotations
 
+import functools
+import lzma
+import os
+import pickle
 import shelve
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Callable
 from typing import Any
+from typing import Protocol
+
+import structlog
+
+import metrics
+from config import settings
+
+log = structlog.get_logger()
 
 CACHE_PATH = "tmp/shelve"
+SQLITE_PATH = "tmp/cache.sqlite"
 
 
-def get(key: str) -> Any | None:
-    with shelve.open(CACHE_PATH) as db:
-        if key in db:
-            return db[key]
-        else:
+def connect(path: str = SQLITE_PATH) -> sqlite3.Connection:
+    """New autocommit connection in WAL mode, shared DB file for all workers."""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+Schema = Callable[[sqlite3.Connection], None]
+
+_local = threading.local()
+
+
+def connect_local(schema: Schema, path: str = SQLITE_PATH) -> sqlite3.Connection:
+    """
+    Long-lived connection to `path` of this thread, `schema(conn)` (create
+    tables ...) run once on it. Per process too: a forked worker never reuses
+    parents connection, neither after `reset()`.
+    """
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.conns = {}
+        _local.pid = os.getpid()
+    conns: dict[tuple[Schema, str], sqlite3.Connection] = _local.conns
+    if (schema, path) not in conns:
+        conn = connect(path)
+        schema(conn)
+        conns[(schema, path)] = conn
+    return conns[(schema, path)]
+
+
+# name -> (compress, decompress), name is stored with each entry. Only `cache`
+# entries go through it (raw payloads with CACHE_RAW_PAYLOADS, quota), not the
+# observations in `crud.store`.
+CODECS: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "none": (bytes, bytes),
+    "zlib": (lambda b: zlib.compress(b, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+try:
+    import zstandard
+except ImportError:  # optional, `poetry install -E zstd`
+    pass
+else:
+    CODECS["zstd"] = (
+        lambda b: zstandard.ZstdCompressor(level=3).compress(b),
+        lambda b: zstandard.ZstdDecompressor().decompress(b),
+    )
+
+
+@functools.lru_cache(maxsize=None)  # warn once
+def codec() -> str:
+    """Codec for new entries (CACHE_CODEC), zlib if zstd is not installed."""
+    if settings.CACHE_CODEC not in CODECS:
+        log.warning("cache codec not available", codec=settings.CACHE_CODEC)
+        return "zlib"
+    return settings.CACHE_CODEC
+
+
+def encode(obj: Any) -> tuple[str, bytes]:
+    """Pickle + compress (small values are not worth it), returns (codec, blob)."""
+    raw = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    name = codec() if len(raw) >= settings.CACHE_COMPRESS_MIN_BYTES else "none"
+    blob = CODECS[name][0](raw)
+    if len(blob) >= len(raw):
+        name, blob = "none", raw
+    metrics.CACHE_RAW_BYTES.inc(len(raw), op="write")
+    return name, blob
+
+
+def decode(name: str, blob: bytes) -> Any:
+    """Inverse of `encode`. ValueError for codec not available here (zstd)."""
+    if name not in CODECS:
+        raise ValueError(f"unknown codec {name!r}")
+    with metrics.CACHE_DECODE_SECONDS.time(codec=name):
+        raw = CODECS[name][1](blob)
+        obj = pickle.loads(raw)
+    metrics.CACHE_RAW_BYTES.inc(len(raw), op="read")
+    return obj
+
+
+class Backend(Protocol):
+    def get(self, key: str) -> Any | None:
+        ...
+
+    def create(self, key: str, obj: Any, ttl: int | None = None) -> None:
+        ...
+
+
+class ShelveBackend:
+    """Old school backend, one dbm open per call. No TTL, no eviction."""
+
+    def __init__(self, path: str = CACHE_PATH) -> None:
+        self.path = path
+
+    def get(self, key: str) -> Any | None:
+        with shelve.open(self.path) as db:
+            if key in db:
+                return db[key]
+            else:
+                return None
+
+    def create(self, key: str, obj: Any, ttl: int | None = None) -> None:
+        with shelve.open(self.path) as db:
+            db[key] = obj
+
+
+class SqliteBackend:
+    """
+    SQLite in WAL mode, safe for several workers (processes) at once.
+
+    Connections are long-lived, one per thread (and per process, so a fork gets
+    its own), which makes a cache hit a single indexed SELECT.
+
+    Entries have optional TTL (`None` = forever). When the DB grows over
+    `max_bytes` (compressed), least recently used entries get evicted.
+
+    Values are compressed, each entry says by which codec (see `encode`), so
+    changing CACHE_CODEC keeps older entries readable.
+    """
+
+    # dont write on every read just to bump LRU timestamp
+    TOUCH_AFTER_S = 60
+
+    def __init__(self, path: str = SQLITE_PATH, max_bytes: int = 0) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL,"
+            " accessed_at REAL NOT NULL,"
+            " codec TEXT NOT NULL DEFAULT 'none'"
+            ")"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(cache)")]
+        if "codec" not in columns:
+            # DB from before compression, its entries are plain pickles
+            try:
+                conn.execute(
+                    "ALTER TABLE cache ADD COLUMN codec TEXT NOT NULL DEFAULT 'none'"
+                )
+            except sqlite3.OperationalError:
+                pass  # other worker just did it
+
+    def connect(self) -> sqlite3.Connection:
+        return connect_local(self.schema, self.path)
+
+    def get(self, key: str) -> Any | None:
+        conn = self.connect()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at, codec FROM cache WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            metrics.CACHE_REQUESTS.inc(result="miss")
+            return None
+
+        value, expires_at, accessed_at, codec_ = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            metrics.CACHE_REQUESTS.inc(result="miss")
+            return None
+        try:
+            obj = decode(codec_, value)
+        except Exception as e:
+            # written with codec not installed here (zstd), or corrupt: a miss,
+            # never a failed request
+            log.warning("cache entry unreadable", key=key, codec=codec_, error=repr(e))
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            metrics.CACHE_REQUESTS.inc(result="miss")
+            return None
+        metrics.CACHE_REQUESTS.inc(result="hit")
+        metrics.CACHE_BYTES.inc(len(value), op="read")
+        if now - accessed_at > self.TOUCH_AFTER_S:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return obj
+
+    def create(self, key: str, obj: Any, ttl: int | None = None) -> None:
+        conn = self.connect()
+        codec_, value = encode(obj)
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn.execute(
+            "INSERT OR REPLACE INTO cache"
+            " (key, value, size, expires_at, accessed_at, codec)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (key, value, len(value), expires_at, now, codec_),
+        )
+        metrics.CACHE_BYTES.inc(len(value), op="write")
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then LRU ones until we fit in `max_bytes`."""
+        conn = self.connect()
+        conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+        if not self.max_bytes:
             return None
 
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if total <= self.max_bytes:
+            return None
+
+        # count how many oldest entries have to go, then drop them in one go
+        evicted = 0
+        rows = conn.execute("SELECT size FROM cache ORDER BY accessed_at")
+        for (size,) in rows.fetchall():
+            if total <= self.max_bytes:
+                break
+            total -= size
+            evicted += 1
+        conn.execute(
+            "DELETE FROM cache WHERE key IN"
+            " (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+            (evicted,),
+        )
+        log.info("cache eviction", evicted=evicted, size=total)
+
+
+_backend: Backend | None = None
+
+
+def backend() -> Backend:
+    """Backend selected via `settings.CACHE_BACKEND`, created once per process."""
+    global _backend
+    if _backend is None:
+        if settings.CACHE_BACKEND == "shelve":
+            _backend = ShelveBackend()
+        else:
+            _backend = SqliteBackend(max_bytes=settings.CACHE_MAX_BYTES)
+    return _backend
+
+
+def reset() -> None:
+    """Forget connections inherited from parent process (call after fork)."""
+    global _backend, _local
+    _backend = None
+    _local = threading.local()
+
+
+def get(key: str) -> Any | None:
+    return backend().get(key)
+
 
-def create(key: str, obj: Any) -> None:
-    with shelve.open(CACHE_PATH) as db:
-        db[key] = obj
+def create(key: str, obj: Any, ttl: int | None = None) -> None:
+    """Save `obj` under `key`, `ttl` in seconds (None = keep forever)."""
+    backend().create(key, obj, ttl=ttl)
@@ -0,0 +1,121 @@
+"""
+Hot frames (L1): process-local LRU of ready DFs in front of the store (L2).
+
+`crud.store.load()` has to filter the memory-mapped snapshot and build a DF
+on every call. Popular ranges (last few months) are asked for all the time, so
+their DFs are kept here, up to `STORE_L1_MAX_BYTES` (by `memory_usage(deep=True)`).
+
+Entries remember store revision of their source, once the store gets new
+observations (by any worker) they are not served anymore.
+"""
+from __future__ import annotations
+
+import collections
+import threading
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+import structlog
+
+import metrics
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = structlog.get_logger()
+
+Key = tuple[str, str, tuple[str, ...], tuple[str, ...], str, str]
+
+
+def key(
+    source: str,
+    currencies: Sequence[str],
+    freqs: Sequence[str],
+    date_from: str,
+    date_to: str,
+) -> Key:
+    """Canonical key, same data asked in different order is one entry."""
+    return (
+        source,
+        settings.BASE,
+        tuple(sorted(currencies)),
+        tuple(sorted(freqs)),
+        date_from,
+        date_to,
+    )
+
+
+class FrameCache:
+    """LRU of DFs capped by their memory size. Thread safe."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: collections.OrderedDict[
+            Key, tuple[int, int, pd.DataFrame]
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Key, rev: int) -> pd.DataFrame | None:
+        """Copy of DF stored under `key`, if it was made from store revision `rev`."""
+        source = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != rev:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                metrics.FRAME_CACHE_REQUESTS.inc(source=source, result="miss")
+                return None
+            self._entries.move_to_end(key)
+        metrics.FRAME_CACHE_REQUESTS.inc(source=source, result="hit")
+        # callers mark DFs (attrs) and concat them, never hand out the cached one
+        return entry[2].copy()
+
+    def put(self, key: Key, rev: int, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (rev, size, df.copy())
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            metrics.FRAME_CACHE_BYTES.set(self.size)
+
+    def invalidate(self, source: str) -> None:
+        """Drop all entries of `source` (they are stale anyway, free memory now)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == source]:
+                self._drop(key)
+            metrics.FRAME_CACHE_BYTES.set(self.size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            metrics.FRAME_CACHE_BYTES.set(0)
+
+    def _drop(self, key: Key) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+_cache: FrameCache | None = None
+
+
+def cache() -> FrameCache | None:
+    """Process-wide L1, None if disabled (`STORE_L1_MAX_BYTES=0`)."""
+    global _cache
+    if _cache is None and settings.STORE_L1_MAX_BYTES:
+        _cache = FrameCache(settings.STORE_L1_MAX_BYTES)
+    return _cache
+
+
+def reset() -> None:
+    """Fresh (empty) L1 and lock, in a forked worker."""
+    global _cache
+    _cache = None
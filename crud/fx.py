@@ -1,25 +1,50 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import io
 import json
+import uuid
+from collections.abc import Awaitable
+from collections.abc import Iterable
+from collections.abc import Sequence
+from datetime import datetime
+from typing import TYPE_CHECKING
 from typing import Any
+from typing import Literal
 
-import investiny.historical
-import investiny.search
-import pandas as pd
-import pendulum
-import requests
 import structlog
 from fastapi import HTTPException
 
 import crud.cache
 import crud.fx
+import crud.http
+import crud.monthly
+import crud.quota
+import crud.router
+import crud.singleflight
+import crud.store
+import metrics
 from config import settings
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 log = structlog.get_logger()
 
+INVESTINY_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like"
+        " Gecko) Chrome/104.0.5112.102 Safari/537.36"
+    ),
+    "Referer": "https://tvc-invdn-com.investing.com/",
+    "Content-Type": "application/json",
+}
+
 
-def get_ecb(date_from: str, date_to: str) -> pd.DataFrame:
+async def get_ecb(
+    date_from: str, date_to: str, currencies: Sequence[str] | None = None
+) -> pd.DataFrame:
     """
     Fetch data from ECB and transform it to DF:
 
@@ -39,38 +64,82 @@ def get_ecb(date_from: str, date_to: str) -> pd.DataFrame:
     Args:
         date_from (str): YYYY-MM-DD
         date_to (str): YYYY-MM-DD
+        currencies (Sequence[str], optional): default ECB_SYMBOLS
+
+    When ECB fails, whatever we have stored is returned, marked stale
+    (`df.attrs["stale"]`).
 
     Raises:
-        HTTPException: 500, if ECB API is unvailable
+        HTTPException: 502/503, if ECB API is unvailable and nothing is stored
 
     Returns:
         pd.DataFrame
     """
+    import pandas as pd
+
+    currencies = list(currencies or settings.ECB_SYMBOLS.split("+"))
 
     logger = log.bind(
         date_from=date_from,
         date_to=date_to,
         source="ECB",
-        symbol=settings.ECB_SYMBOLS,
+        symbol="+".join(currencies),
     )
 
-    params = {"format": "csvdata", "startPeriod": date_from, "endPeriod": date_to}
-    key = params | {"symbols": settings.ECB_SYMBOLS, "base": settings.BASE}
-    if csv := crud.cache.get(key=json.dumps(key)):
+    # monthly are averages of daily, fetched only to verify ours (crud.monthly)
+    derive = crud.monthly.derived("ecb")
+    freqs = ["D"] if derive and not settings.MONTHLY_VERIFY else ["D", "M"]
+    todo = crud.store.plan("ecb", currencies, freqs, date_from, date_to)
+    metrics.STORE_REQUESTS.inc(source="ecb", result="miss" if todo else "hit")
+    if not todo:
         logger.info("getting data from cache")
-    else:
-        logger.info("getting data via API")
-        response = requests.get(
-            f"{settings.ECB_ENDPOINT}D+M.{settings.ECB_SYMBOLS}.{settings.BASE}.SP00.A",
-            params=params,
+
+    async def fetch(symbols: tuple[str, ...], span_from: str, span_to: str) -> None:
+        if not crud.store.plan("ecb", symbols, freqs, span_from, span_to):
+            return None  # other worker got it meanwhile
+        logger.info("getting data via API", span=(span_from, span_to))
+        response = await crud.http.get(
+            "ecb",
+            f"{settings.ECB_ENDPOINT}{'+'.join(freqs)}.{'+'.join(symbols)}"
+            f".{settings.BASE}.SP00.A",
+            params={
+                "format": "csvdata",
+                "startPeriod": span_from,
+                "endPeriod": span_to,
+            },
         )
         if response.status_code // 100 == 2:
-            csv = response.content
-            crud.cache.create(key=json.dumps(key), obj=csv)
+            audit("ecb", symbols, span_from, span_to, payload=response.content)
+            df = parse_ecb(response.content)
+        elif response.status_code == 404:
+            # ECB says 404 if there are no observations in span (eg. weekend)
+            df = pd.DataFrame(columns=crud.store.COLS)
         else:
-            raise HTTPException(status_code=500, detail="failed to fetch data from ECB")
+            raise crud.http.UpstreamError("ecb", f"HTTP {response.status_code}")
+        crud.store.save(df, "ecb", symbols, freqs, (span_from, span_to))
+
+    errors = await _gather(
+        crud.singleflight.do(
+            crud.singleflight.key("ecb", settings.BASE, symbols, span),
+            functools.partial(fetch, symbols, *span),
+        )
+        for symbols, span in todo
+    )
+
+    df = crud.store.load("ecb", currencies, freqs, date_from, date_to)
+    if derive:
+        monthly = crud.monthly.average(df, date_from, date_to)
+        if settings.MONTHLY_VERIFY:
+            crud.monthly.verify(monthly, df.loc[df["freq"].eq("M")], "ecb")
+        df = pd.concat([df.loc[df["freq"].eq("D")], monthly], ignore_index=True)
+    return _served("ecb", df, errors)
+
 
-    df = (
+def parse_ecb(csv: bytes) -> pd.DataFrame:
+    """ECB SDMX csv -> normalized DF."""
+    import pandas as pd
+
+    return (
         pd.read_csv(io.BytesIO(csv))
         .loc[:, ["CURRENCY", "FREQ", "TIME_PERIOD", "OBS_VALUE"]]
         .rename(
@@ -84,14 +153,17 @@ def get_ecb(date_from: str, date_to: str) -> pd.DataFrame:
         .assign(source="ecb")
     )
 
-    return df
-
 
-def get_apilayer(date_from: str, date_to: str) -> pd.DataFrame:
+async def get_apilayer(
+    date_from: str, date_to: str, currencies: Sequence[str] | None = None
+) -> pd.DataFrame:
     """
     Fetch FX rates from Apilayer exchange API.
     Currently, there is a limit of 250 calls/month.
 
+    Daily only, monthly averages are derived from them (MONTHLY_DERIVE,
+    see `crud.monthly`).
+
     Func returns dataframe:
 
                  ts currency         value freq
@@ -110,61 +182,95 @@ def get_apilayer(date_from: str, date_to: str) -> pd.DataFrame:
     Args:
         date_from (str): YYYY-MM-DD
         date_to (str): YYYY-MM-DD
+        currencies (Sequence[str], optional): default APILAYER_SYMBOLS, any
+            other currency works too (see `crud.router`)
+
+    When apilayer fails, whatever we have stored is returned, marked stale
+    (`df.attrs["stale"]`).
 
     Raises:
-        HTTPException: 500, if Apilayer API is unvailable or quota is reached
+        HTTPException: 502/503, if Apilayer API is unvailable or quota is reached
+            and nothing is stored
 
     Returns:
         pd.DataFrame
     """
+    import pandas as pd
+
+    currencies = list(currencies or settings.APILAYER_SYMBOLS.split(","))
 
     logger = log.bind(
         date_from=date_from,
         date_to=date_to,
         source="apilayer.com",
-        symbol=settings.APILAYER_SYMBOLS,
+        symbol=",".join(currencies),
     )
 
-    params = {
-        "start_date": date_from,
-        "end_date": date_to,
-        "base": settings.BASE,
-        "symbols": settings.APILAYER_SYMBOLS,
-    }
-    jsondata: bytes | Any  # shall be bytes if all OK
-    if jsondata := crud.cache.get(key=json.dumps(params)):
+    todo = crud.store.plan("apilayer", currencies, ["D"], date_from, date_to)
+    metrics.STORE_REQUESTS.inc(source="apilayer", result="miss" if todo else "hit")
+    if not todo:
         logger.info("getting data from cache")
-    else:
-        logger.info("getting data via API")
-        response = requests.get(
-            url=f"{settings.APILAYER_ENDPOINT}timeseries",
+
+    async def fetch(symbols: tuple[str, ...], span_from: str, span_to: str) -> None:
+        if not crud.store.plan("apilayer", symbols, ["D"], span_from, span_to):
+            return None  # other worker got it meanwhile
+        logger.info("getting data via API", span=(span_from, span_to))
+        response = await crud.http.get(
+            "apilayer",
+            f"{settings.APILAYER_ENDPOINT}timeseries",
             headers={"apikey": settings.APILAYER_API_KEY.get_secret_value()},
-            params=params,
+            params={
+                "start_date": span_from,
+                "end_date": span_to,
+                "base": settings.BASE,
+                "symbols": ",".join(symbols),
+            },
         )
-        if response.status_code // 100 == 2:
-            jsondata = response.content
-            crud.cache.create(key=json.dumps(params), obj=jsondata)
-
-            # save latest quota values for frontend
-            quota = {
-                "remaining": int(
-                    response.headers.get("X-RateLimit-Remaining-Month", 0)
-                ),
-                "limit": int(response.headers.get("X-RateLimit-Limit-Month", 0)),
-            }
-            crud.cache.create(key="apilayer_quota", obj=quota)
-        else:
-            # just crash .. Bea will call
-            raise HTTPException(
-                status_code=500,
-                detail="failed to fetch data from apilayer.com",
-            )
-
-    df = (
-        pd.DataFrame.from_dict(
-            json.loads(jsondata).get("rates"),
-            orient="index",
+        if response.status_code // 100 != 2:
+            raise crud.http.UpstreamError("apilayer", f"HTTP {response.status_code}")
+        audit("apilayer", symbols, span_from, span_to, payload=response.content)
+
+        # save latest quota values for frontend
+        quota = {
+            "remaining": int(response.headers.get("X-RateLimit-Remaining-Month", 0)),
+            "limit": int(response.headers.get("X-RateLimit-Limit-Month", 0)),
+        }
+        crud.quota.update(quota)
+
+        # error in body raises, span is then not marked as fetched
+        df = parse_apilayer(response.content)
+        crud.store.save(df, "apilayer", symbols, ["D"], (span_from, span_to))
+
+    errors = await _gather(
+        crud.singleflight.do(
+            crud.singleflight.key("apilayer", settings.BASE, symbols, span),
+            functools.partial(fetch, symbols, *span),
         )
+        for symbols, span in todo
+    )
+
+    df = crud.store.load("apilayer", currencies, ["D"], date_from, date_to)
+    if crud.monthly.derived("apilayer"):
+        monthly = crud.monthly.average(df, date_from, date_to)
+        df = pd.concat([df, monthly], ignore_index=True)
+    return _served("apilayer", df, errors)
+
+
+def parse_apilayer(jsondata: bytes | Any) -> pd.DataFrame:
+    """
+    Apilayer timeseries json -> normalized DF.
+    UpstreamError, if it is an error (they come with HTTP 200 too).
+    """
+    import pandas as pd
+
+    body = json.loads(jsondata)
+    if not body.get("success", True) or "rates" not in body:
+        raise crud.http.UpstreamError("apilayer", f"no rates: {body.get('error')}")
+    if not (rates := body["rates"]):
+        return pd.DataFrame(columns=crud.store.COLS)
+
+    return (
+        pd.DataFrame.from_dict(rates, orient="index")
         .reset_index()
         .melt(id_vars="index")
         .rename(columns={"index": "ts", "variable": "currency"})
@@ -172,13 +278,14 @@ def get_apilayer(date_from: str, date_to: str) -> pd.DataFrame:
         .assign(source="apilayer")
     )
 
-    return df
 
+async def get_investiny(
+    date_from: str, date_to: str, currencies: Sequence[str] | None = None
+) -> pd.DataFrame:
+    import pendulum
 
-def get_investiny(date_from: str, date_to: str) -> pd.DataFrame:
     logger = log.bind(date_from=date_from, date_to=date_to, source="investiny")
 
-    from_date = pendulum.from_format(date_from, "YYYY-MM-DD")
     to_date = pendulum.from_format(date_to, "YYYY-MM-DD")
     to_date_monthly = to_date
     # dont do monthly if you cant return full month
@@ -186,62 +293,200 @@ def get_investiny(date_from: str, date_to: str) -> pd.DataFrame:
         # lets go one month less (to last day of it)
         to_date_monthly = to_date.subtract(months=1).end_of("month")
 
-    # USA date format, lol..
-    date_from_usa = from_date.format("MM/DD/YYYY")
-    # date_to_usa = to_date.format("MM/DD/YYYY")  # daily not yet done
-    date_to_usa_monthly = to_date_monthly.format("MM/DD/YYYY")
+    date_to_monthly = to_date_monthly.format("YYYY-MM-DD")
 
-    # do monthly
-    dates = []
-    cursor = from_date
-    while cursor < to_date_monthly:
-        dates.append(cursor.format("YYYY-MM"))
-        cursor = cursor.add(months=1)
+    async def fetch(symbol: str, id_: int, span_from: str, span_to: str) -> None:
+        currency = symbol.split("/")[1]  # EUR/RSD -> RSD
+        if not crud.store.plan("investiny", [currency], ["M"], span_from, span_to):
+            return None  # other worker got it meanwhile
+        logger.info("getting data via API", symbol=symbol, span=(span_from, span_to))
+        span_from_ = pendulum.from_format(span_from, "YYYY-MM-DD")
+        span_to_ = pendulum.from_format(span_to, "YYYY-MM-DD")
+        dic = await investiny_historical_data(
+            investing_id=id_,
+            # USA date format, lol..
+            from_date=span_from_.format("MM/DD/YYYY"),
+            to_date=span_to_.format("MM/DD/YYYY"),
+            interval="M",
+        )
+
+        audit("investiny", id_, span_from, span_to, payload=dic)
+        df = parse_investiny(dic, currency, span_from, span_to)
+        crud.store.save(df, "investiny", [currency], ["M"], (span_from, span_to))
 
-    monthly = []
+    wanted = currencies
+    currencies = []
+    fetches = []
     for symbol, id_ in settings.INVESTINY_SYMBOLS.items():
-        key = f"M|{id_}|{symbol}--{date_from_usa}--{date_to_usa_monthly}"
+        currency = symbol.split("/")[1]
+        if wanted and currency not in wanted:
+            continue
+        currencies.append(currency)
 
-        if dic := crud.cache.get(key=key):
+        todo = crud.store.plan(
+            "investiny", [currency], ["M"], date_from, date_to_monthly
+        )
+        metrics.STORE_REQUESTS.inc(source="investiny", result="miss" if todo else "hit")
+        if not todo:
             logger.info("getting data from cache", symbol=symbol)
-        else:
-            logger.info("getting data via API", symbol=symbol)
-            dic = investiny.historical.historical_data(
-                investing_id=id_,
-                from_date=date_from_usa,
-                to_date=date_to_usa_monthly,
-                interval="M",
+        fetches += [
+            crud.singleflight.do(
+                crud.singleflight.key("investiny", id_, span),
+                functools.partial(fetch, symbol, id_, *span),
             )
-            crud.cache.create(key=key, obj=dic)
+            for _, span in todo
+        ]
 
-        # dic data go from oldes mon to newest
-        currency = symbol.split("/")[1]  # EUR/RSD -> RSD
-        df = pd.DataFrame.from_dict(dic).assign(currency=currency)
-        df.index = dates
-        monthly.append(df)
+    # all symbols at once
+    errors = await _gather(fetches)
 
     # do daily
     # NOTE Its a problem now, coz investiny API returns only a list of values,
     # NOTE but I dont know what are the dates? Where were banking holidays? Dunno.
 
-    df = (
-        pd.concat(monthly)
-        .reset_index()
+    df = crud.store.load("investiny", currencies, ["M"], date_from, date_to_monthly)
+    return _served("investiny", df, errors)
+
+
+async def _gather(fetches: Iterable[Awaitable]) -> list[crud.http.UpstreamError]:
+    """Run all `fetches`, even if some fail; upstream errors are returned."""
+    errors = []
+    for result in await asyncio.gather(*fetches, return_exceptions=True):
+        if isinstance(result, crud.http.UpstreamError):
+            errors.append(result)
+        elif isinstance(result, BaseException):
+            raise result
+    return errors
+
+
+def _served(
+    source: str, df: pd.DataFrame, errors: list[crud.http.UpstreamError]
+) -> pd.DataFrame:
+    """
+    Stored data `df`, marked stale if (some) upstream fetches failed, it may
+    then be old or incomplete. Error, if there is nothing to serve at all.
+    """
+    if not errors:
+        return df
+    if df.empty:
+        circuit_open = all(isinstance(e, crud.http.CircuitOpen) for e in errors)
+        raise HTTPException(
+            status_code=503 if circuit_open else 502,
+            detail=f"{source} is unavailable ({errors[0].reason})",
+        )
+    log.warning("serving stale data", source=source, errors=[str(e) for e in errors])
+    metrics.STALE_RESPONSES.inc(source=source)
+    df.attrs["stale"] = True
+    return df
+
+
+def parse_investiny(
+    dic: dict[str, Any], currency: str, span_from: str, span_to: str
+) -> pd.DataFrame:
+    """Investiny monthly history (values only, no dates) -> normalized DF."""
+    import pandas as pd
+    import pendulum
+
+    span_from_ = pendulum.from_format(span_from, "YYYY-MM-DD")
+    span_to_ = pendulum.from_format(span_to, "YYYY-MM-DD")
+
+    # dic data go from oldes mon to newest
+    dates = []
+    cursor = span_from_
+    while cursor < span_to_:
+        dates.append(cursor.format("YYYY-MM"))
+        cursor = cursor.add(months=1)
+
+    df = pd.DataFrame.from_dict(dic).assign(currency=currency)
+    df.index = dates
+    return (
+        df.reset_index()
         .loc[:, ["index", "close", "currency"]]
         .assign(freq="M")
         .rename(columns={"index": "ts", "close": "value"})
         .assign(source="investiny")
     )
 
+
+def audit(*key: Any, payload: Any) -> None:
+    """Keep raw upstream payload, optional (CACHE_RAW_PAYLOADS), nothing reads it."""
+    if settings.CACHE_RAW_PAYLOADS:
+        crud.cache.create(key=json.dumps(["raw", *key]), obj=payload)
+
+
+FETCHERS = {"ecb": get_ecb, "apilayer": get_apilayer, "investiny": get_investiny}
+
+
+async def get_all(date_from: str, date_to: str, sources: Iterable[str]) -> pd.DataFrame:
+    """
+    Rates asked for by `sources`, each (currency, freq, month) from the cheapest
+    of them (see `crud.router`), all sources at once (latency = the slowest one),
+    concatenated.
+    `df.attrs["stale"]` lists sources served from store only (upstream failed).
+    """
+    import pandas as pd
+
+    routes = crud.router.route(date_from, date_to, sources)
+
+    async def fetch(source: str, cells: list[crud.router.Cell]) -> pd.DataFrame:
+        span_from, span_to = crud.router.span(cells, date_from, date_to)
+        df = await FETCHERS[source](
+            date_from=span_from,
+            date_to=span_to,
+            currencies=sorted({currency for currency, _, _ in cells}),
+        )
+        stale = df.attrs.get("stale")
+        df = crud.router.only(df, cells)
+        df.attrs["stale"] = stale
+        return df
+
+    frames = await asyncio.gather(*(fetch(s, cells) for s, cells in routes.items()))
+    df = pd.concat([pd.DataFrame(), *frames])
+    df.attrs["stale"] = [s for s, f in zip(routes, frames) if f.attrs.get("stale")]
     return df
 
 
+async def investiny_historical_data(
+    investing_id: int,
+    from_date: str,
+    to_date: str,
+    interval: Literal["D", "W", "M"] = "D",
+) -> dict[str, Any]:
+    """
+    Same as `investiny.historical.historical_data`, but async via our shared client.
+
+    Dates as MM/DD/YYYY.
+    """
+    params = {
+        "symbol": investing_id,
+        "from": int(datetime.strptime(from_date, "%m/%d/%Y").timestamp()),
+        "to": int(datetime.strptime(to_date, "%m/%d/%Y").timestamp()),
+        "resolution": interval,
+    }
+    response = await crud.http.get(
+        "investiny",
+        f"{settings.INVESTINY_ENDPOINT}{uuid.uuid4().hex}/0/0/0/0/history",
+        params=params,
+        headers=INVESTINY_HEADERS,
+    )
+    if response.status_code != 200:
+        raise crud.http.UpstreamError("investiny", f"HTTP {response.status_code}")
+    try:
+        data = response.json()
+    except ValueError:
+        raise crud.http.UpstreamError("investiny", "not json") from None
+    if data.get("s") != "ok":  # eg. "no_data", "error"
+        raise crud.http.UpstreamError("investiny", f"status {data.get('s')!r}")
+    return {"open": data["o"], "high": data["h"], "low": data["l"], "close": data["c"]}
+
+
 def get_investing_id(symbol: str):
     """
     Dev helper function.
 
     Ask for a ticker and get internal investing.com ID, so it can be used in investiny.
     """
+    import investiny.search
 
     res = investiny.search.search_assets(query=symbol, limit=1)
     log.info(res)
@@ -0,0 +1,200 @@
+"""
+One async HTTP client for the whole app lifetime (keep-alive, connection pool)
+and per-source policy, so we dont hammer any upstream and a broken one does not
+hang us: concurrency limit, timeouts, retries with jittered backoff and circuit
+breaker (fail fast while upstream is down).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+
+import httpx
+import structlog
+
+import metrics
+from config import settings
+
+log = structlog.get_logger()
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+_pid: int | None = None
+_limits: dict[str, asyncio.Semaphore] = {}
+_breakers: dict[str, Breaker] = {}
+
+
+class UpstreamError(Exception):
+    """Upstream failed even after retries (or was not called, see `CircuitOpen`)."""
+
+    def __init__(self, source: str, reason: str) -> None:
+        super().__init__(f"{source}: {reason}")
+        self.source = source
+        self.reason = reason
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+class Breaker:
+    """
+    Circuit breaker of one source. After BREAKER_FAILURES failed calls in a row
+    it opens (calls fail fast), after BREAKER_RESET_S one trial call goes
+    through (half-open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        waited = time.monotonic() - self.opened_at
+        if not self.trial and waited >= settings.BREAKER_RESET_S:
+            self.trial = True
+            return True
+        return False
+
+    def blocked(self) -> bool:
+        """Failing fast now (like `allow`, but without using up the trial call)."""
+        if self.opened_at is None:
+            return False
+        waited = time.monotonic() - self.opened_at
+        return self.trial or waited < settings.BREAKER_RESET_S
+
+    def abandon(self) -> None:
+        """Call ended without verdict (cancelled), next one may be the trial."""
+        self.trial = False
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            log.info("circuit closed", source=self.source)
+            metrics.CIRCUIT_OPEN.set(0, source=self.source)
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.failures >= settings.BREAKER_FAILURES:
+            if self.opened_at is None:
+                log.warning("circuit open", source=self.source, failures=self.failures)
+                metrics.CIRCUIT_OPEN.set(1, source=self.source)
+            self.opened_at = time.monotonic()
+
+
+def client() -> httpx.AsyncClient:
+    global _client, _pid
+    if _client is None or _pid != os.getpid():
+        # lazily, and never share connections with a parent process after fork
+        _client = httpx.AsyncClient(
+            timeout=settings.HTTP_TIMEOUT_S,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+        _pid = os.getpid()
+        _limits.clear()
+        _breakers.clear()
+    return _client
+
+
+def limit(source: str) -> asyncio.Semaphore:
+    """Semaphore capping concurrent calls to `source` (see HTTP_CONCURRENCY)."""
+    if source not in _limits:
+        _limits[source] = asyncio.Semaphore(settings.HTTP_CONCURRENCY.get(source, 4))
+    return _limits[source]
+
+
+def breaker(source: str) -> Breaker:
+    if source not in _breakers:
+        _breakers[source] = Breaker(source)
+    return _breakers[source]
+
+
+def timeout(source: str) -> httpx.Timeout:
+    read = settings.HTTP_READ_TIMEOUT_S.get(source, settings.HTTP_TIMEOUT_S)
+    return httpx.Timeout(read, connect=settings.HTTP_CONNECT_TIMEOUT_S)
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: random wait up to exponentially growing cap."""
+    cap = settings.HTTP_BACKOFF_S * 2 ** (attempt - 1)
+    return random.uniform(0, min(cap, settings.HTTP_BACKOFF_MAX_S))
+
+
+async def get(source: str, url: str, **kwargs) -> httpx.Response:
+    """
+    GET to upstream `source`, within its policy, measured.
+
+    Returns response (4xx too, callers know what it means for them). Raises
+    `UpstreamError` when upstream keeps failing (timeouts, 429, 5xx), or
+    `CircuitOpen` without calling it at all when it failed too much lately.
+    """
+    client_ = client()
+    breaker_ = breaker(source)
+    if not breaker_.allow():
+        metrics.UPSTREAM_ERRORS.inc(source=source, status="circuit_open")
+        raise CircuitOpen(source, "circuit open")
+
+    reason = ""
+    settled = False
+    try:
+        for attempt in range(1 + settings.HTTP_RETRIES):
+            if attempt:
+                metrics.UPSTREAM_RETRIES.inc(source=source)
+                await asyncio.sleep(backoff(attempt))
+            async with limit(source):
+                with metrics.UPSTREAM_SECONDS.time(source=source):
+                    try:
+                        response = await client_.get(
+                            url, timeout=timeout(source), **kwargs
+                        )
+                    except httpx.HTTPError as e:
+                        # timeouts, refused or dropped connections, broken body ...
+                        metrics.UPSTREAM_ERRORS.inc(
+                            source=source, status=type(e).__name__
+                        )
+                        reason = repr(e)
+                        continue
+            if response.status_code // 100 != 2:
+                metrics.UPSTREAM_ERRORS.inc(
+                    source=source, status=str(response.status_code)
+                )
+            if response.status_code in RETRY_STATUS:
+                reason = f"HTTP {response.status_code}"
+                continue
+            breaker_.success()
+            settled = True
+            return response
+
+        breaker_.failure()
+        settled = True
+    finally:
+        if not settled:
+            # cancelled (or bug) midway, a trial call must not stay taken forever
+            breaker_.abandon()
+    log.warning("upstream failed", source=source, reason=reason)
+    raise UpstreamError(source, reason)
+
+
+def reset() -> None:
+    """Forget client inherited from parent process (call after fork)."""
+    global _client, _pid
+    _client = None
+    _pid = None
+    _limits.clear()
+    _breakers.clear()
+
+
+async def aclose() -> None:
+    global _client
+    if _client is not None and _pid == os.getpid():
+        await _client.aclose()
+    _client = None
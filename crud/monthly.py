@@ -0,0 +1,109 @@
+"""
+Monthly rates from daily ones, so no source has to be asked for monthly data.
+
+Monthly = average of daily observations in the month (as ECB does it), only
+for months whole in the range. Spot = last daily observation of the month.
+Both vectorized, by grouping on month periods.
+
+With MONTHLY_VERIFY, ECB monthly figures are fetched too and compared with
+derived ones (`verify`), to know our averages match the official ones.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import structlog
+
+import metrics
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = structlog.get_logger()
+
+COLS = ["currency", "freq", "ts", "value", "source"]
+DERIVED = ("ecb", "apilayer")  # sources with daily data
+
+
+def derived(source: str) -> bool:
+    """Monthly rates of `source` come from its daily ones."""
+    return settings.MONTHLY_DERIVE and source in DERIVED
+
+
+def _months(ts: pd.Series) -> pd.Series:
+    import pandas as pd
+
+    return pd.to_datetime(ts, format="%Y-%m-%d").dt.to_period("M")
+
+
+def whole_months(date_from: str, date_to: str) -> tuple[pd.Period, pd.Period]:
+    """(first, last) month whole in range (YYYY-MM-DD), first > last if none."""
+    import pandas as pd
+
+    first = pd.Period(date_from, freq="M")
+    if pd.Timestamp(date_from) != first.start_time:
+        first += 1
+    last = pd.Period(date_to, freq="M")
+    if pd.Timestamp(date_to) != last.end_time.normalize():
+        last -= 1
+    return first, last
+
+
+def average(df: pd.DataFrame, date_from: str, date_to: str) -> pd.DataFrame:
+    """
+    Monthly averages of daily rows in `df` (normalized), for months whole in
+    range `date_from` - `date_to` (YYYY-MM-DD). Same shape, freq "M", ts YYYY-MM.
+    """
+    import pandas as pd
+
+    daily = df.loc[df["freq"].eq("D")]
+    if daily.empty:
+        return pd.DataFrame(columns=COLS)
+
+    first, last = whole_months(date_from, date_to)
+    month = _months(daily["ts"])  # named "ts"
+    whole = (month >= first) & (month <= last)
+    if not whole.any():
+        return pd.DataFrame(columns=COLS)
+    out = (
+        daily.loc[whole]
+        .groupby(["currency", "source", month.loc[whole]], sort=False)["value"]
+        .mean()
+        .reset_index()
+    )
+    return out.assign(freq="M", ts=out["ts"].dt.strftime("%Y-%m")).loc[:, COLS]
+
+
+def month_end(daily: pd.DataFrame) -> pd.DataFrame:
+    """Last row of each (currency, month), `daily` sorted by currency, ts."""
+    month = _months(daily["ts"])
+    return daily.groupby([daily["currency"], month], sort=False).tail(1)
+
+
+def verify(derived: pd.DataFrame, official: pd.DataFrame, source: str) -> int:
+    """
+    Compare `derived` monthly rows with `official` ones (same currency + month),
+    log and count those off by more than MONTHLY_TOLERANCE (relative).
+    Returns number of mismatches.
+    """
+    both = derived.merge(
+        official.loc[:, ["currency", "ts", "value"]],
+        on=["currency", "ts"],
+        suffixes=("", "_official"),
+    )
+    diff = (both["value"] - both["value_official"]).abs()
+    off = both.loc[diff > settings.MONTHLY_TOLERANCE * both["value_official"].abs()]
+    metrics.MONTHLY_CHECKS.inc(len(both) - len(off), source=source, result="ok")
+    if len(off):
+        metrics.MONTHLY_CHECKS.inc(len(off), source=source, result="mismatch")
+        log.warning(
+            "derived monthly rates differ from official",
+            source=source,
+            checked=len(both),
+            mismatches=len(off),
+            sample=off.head(5)
+            .loc[:, ["currency", "ts", "value", "value_official"]]
+            .to_dict("records"),
+        )
+    return len(off)
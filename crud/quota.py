@@ -0,0 +1,36 @@
+"""
+Apilayer quota ({"remaining": int, "limit": int}), kept in process memory.
+
+Cache is read at most once per QUOTA_REFRESH_S (other workers may have
+written newer one), also when there is nothing stored yet: a miss is kept
+as well, so quota bar polls never go to disk. Writes go to cache + snapshot
+at once.
+"""
+from __future__ import annotations
+
+import time
+
+import crud.cache
+import metrics
+from config import settings
+
+KEY = "apilayer_quota"
+
+_snapshot: dict | None = None
+_loaded_at: float | None = None  # monotonic, None = never read
+
+
+def get() -> dict | None:
+    global _snapshot, _loaded_at
+    if _loaded_at is None or time.monotonic() - _loaded_at > settings.QUOTA_REFRESH_S:
+        _snapshot = crud.cache.get(key=KEY) or _snapshot
+        _loaded_at = time.monotonic()
+    return _snapshot
+
+
+def update(quota: dict) -> None:
+    global _snapshot, _loaded_at
+    crud.cache.create(key=KEY, obj=quota)
+    _snapshot = quota
+    _loaded_at = time.monotonic()
+    metrics.APILAYER_QUOTA.set(quota["remaining"])
@@ -0,0 +1,210 @@
+"""
+Provider router: which source serves each requested (currency, freq, month),
+when more of them can (apilayer has any currency daily, so also ECB ones, and
+monthly averages come from daily, so apilayer has monthly too).
+
+Each (currency, freq) has one owner: the first by ROUTER_PRIORITY of checked
+sources set up for it (`native`), so the same request always gets the same
+figures, whatever is in store. Others only stand in while the owner is out of
+question, and only if their rates mean the same (`meaning`, apilayer monthly
+averages never replace investiny month close). Then the cheapest stand-in wins.
+What a source already has in store costs nothing, otherwise its observed
+latency (mean of `fx_upstream_seconds`, ROUTER_LATENCY_S until measured),
+apilayer also its quota (ROUTER_QUOTA_COST_S, growing as quota drains, out of
+question below ROUTER_APILAYER_RESERVE). A source with open circuit breaker is
+out of question too. A source which gets called for a month anyway serves the
+rest of that month for free (same call). Ties go by ROUTER_PRIORITY.
+
+Cells only one source can give are routed first, they decide which calls have
+to happen. Each source then gets one fetch for its cells (see `crud.fx.get_all`).
+"""
+from __future__ import annotations
+
+import datetime as dt
+import math
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+import structlog
+
+import crud.http
+import crud.monthly
+import crud.quota
+import crud.store
+import metrics
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = structlog.get_logger()
+
+Cell = tuple[str, str, str]  # (currency, freq, YYYY-MM)
+
+
+def native(source: str) -> dict[str, list[str]]:
+    """freq -> currencies `source` is set up for (what its checkbox asks for)."""
+    if source == "ecb":
+        ecb = settings.ECB_SYMBOLS.split("+")
+        return {"D": ecb, "M": ecb}
+    if source == "apilayer":
+        apilayer = settings.APILAYER_SYMBOLS.split(",")
+        if crud.monthly.derived(source):
+            return {"D": apilayer, "M": apilayer}
+        return {"D": apilayer}
+    return {"M": [symbol.split("/")[1] for symbol in settings.INVESTINY_SYMBOLS]}
+
+
+def offers(source: str) -> dict[str, set[str]]:
+    """freq -> currencies `source` can give."""
+    out = {freq: set(currencies) for freq, currencies in native(source).items()}
+    if source == "apilayer":
+        out["D"] |= set(settings.ECB_SYMBOLS.split("+"))
+        if crud.monthly.derived(source):
+            out["M"] = out["D"]
+    return out
+
+
+def meaning(source: str, freq: str) -> str:
+    """What `freq` rates of `source` are, sources may stand in for same ones only."""
+    if freq == "M":
+        return "close" if source == "investiny" else "average"
+    return "daily"
+
+
+def months(date_from: str, date_to: str) -> dict[str, crud.store.Span]:
+    """YYYY-MM -> its part of the range."""
+    out = {}
+    cursor = dt.date.fromisoformat(date_from).replace(day=1)
+    end = dt.date.fromisoformat(date_to)
+    while cursor <= end:
+        following = (cursor + dt.timedelta(days=32)).replace(day=1)
+        last = following - dt.timedelta(days=1)
+        out[cursor.isoformat()[:7]] = (
+            max(cursor.isoformat(), date_from),
+            min(last.isoformat(), date_to),
+        )
+        cursor = following
+    return out
+
+
+def latency(source: str) -> float:
+    """Mean upstream call of `source` in this worker, seconds."""
+    mean = metrics.UPSTREAM_SECONDS.mean(source=source)
+    if mean is None:
+        return settings.ROUTER_LATENCY_S.get(source, 1)
+    return mean
+
+
+def quota_cost() -> float:
+    quota = crud.quota.get()
+    if not quota or not quota.get("limit"):
+        return settings.ROUTER_QUOTA_COST_S  # dont know yet
+    if quota["remaining"] <= settings.ROUTER_APILAYER_RESERVE:
+        return math.inf
+    return settings.ROUTER_QUOTA_COST_S * quota["limit"] / quota["remaining"]
+
+
+def call_cost(source: str) -> float:
+    """What calling upstream `source` costs, in seconds of waiting."""
+    if crud.http.breaker(source).blocked():
+        return math.inf
+    cost = latency(source)
+    if source == "apilayer":
+        cost += quota_cost()
+    return cost
+
+
+def route(
+    date_from: str, date_to: str, sources: Iterable[str]
+) -> dict[str, list[Cell]]:
+    """
+    Cells asked for by `sources` (their native currencies), each assigned to
+    its owner, or the cheapest stand-in while the owner is out of question, as
+    source -> cells.
+    """
+    rank = {s: i for i, s in enumerate(settings.ROUTER_PRIORITY.split(","))}
+    sources = sorted(set(sources), key=lambda s: (rank.get(s, len(rank)), s))
+    spans = months(date_from, date_to)
+    costs = {source: call_cost(source) for source in sources}
+    natives = {source: native(source) for source in sources}
+
+    owners: dict[tuple[str, str], str] = {}  # (currency, freq) -> source
+    for source in sources:  # by priority, first one wins
+        for freq, currencies in natives[source].items():
+            for currency in currencies:
+                owners.setdefault((currency, freq), source)
+
+    candidates: dict[Cell, list[str]] = {}
+    for (currency, freq), owner in owners.items():
+        able = [
+            s
+            for s in sources
+            if currency in offers(s).get(freq, ())
+            and meaning(s, freq) == meaning(owner, freq)
+        ]
+        for month in spans:
+            candidates[(currency, freq, month)] = able
+
+    covered: dict[tuple[str, str, str], list[crud.store.Span]] = {}
+
+    def cached(source: str, cell: Cell) -> bool:
+        currency, freq, month = cell
+        if freq == "M" and crud.monthly.derived(source):
+            freq = "D"  # monthly are made from daily
+        key = (source, currency, freq)
+        if key not in covered:
+            covered[key] = crud.store.covered(*key)
+        return not crud.store.subtract(spans[month], covered[key])
+
+    called: set[tuple[str, str]] = set()  # (source, month)
+
+    def cost(source: str, cell: Cell) -> tuple[bool, bool, float, int]:
+        currency, freq, month = cell
+        owner = source == owners[(currency, freq)]
+        if costs[source] == math.inf:
+            return (True, not owner, 0.0, rank.get(source, len(rank)))
+        if owner:
+            return (False, False, 0.0, 0)  # owner serves, stored or not
+        if cached(source, cell) or (source, month) in called:
+            cost_ = 0.0
+        else:
+            cost_ = costs[source]
+        return (False, True, cost_, rank.get(source, len(rank)))
+
+    routes: dict[str, list[Cell]] = {}
+    for cell in sorted(candidates, key=lambda x: (len(candidates[x]), x)):
+        source = min(candidates[cell], key=lambda s: cost(s, cell))
+        fetch = not cached(source, cell)
+        if fetch and costs[source] < math.inf:
+            called.add((source, cell[2]))
+        routes.setdefault(source, []).append(cell)
+        metrics.ROUTED_CELLS.inc(source=source, result="fetch" if fetch else "store")
+
+    log.info(
+        "routed",
+        date_from=date_from,
+        date_to=date_to,
+        cells={s: len(cells) for s, cells in routes.items()},
+        calls=sorted(called),
+    )
+    return routes
+
+
+def span(cells: Iterable[Cell], date_from: str, date_to: str) -> crud.store.Span:
+    """Smallest part of the range with all `cells` in it (fetched in one go)."""
+    spans = months(date_from, date_to)
+    parts = [spans[month] for _, _, month in cells]
+    return min(a for a, _ in parts), max(b for _, b in parts)
+
+
+def only(df: pd.DataFrame, cells: Iterable[Cell]) -> pd.DataFrame:
+    """Rows of `df` (normalized) in `cells`, the rest is served by someone else."""
+    import pandas as pd
+
+    keep = pd.DataFrame(list(cells), columns=["currency", "freq", "month"])
+    return (
+        df.assign(month=df["ts"].str[:7])
+        .merge(keep, on=["currency", "freq", "month"])
+        .drop(columns="month")
+    )
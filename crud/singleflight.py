@@ -0,0 +1,62 @@
+"""
+Single-flight: identical upstream fetches running at the same time are done once.
+
+Within a worker, later callers await the task of the first one. Across workers,
+the fetch runs under a file lock (flock), so the second worker waits and then
+finds data in store (fetch functions must re-check store, see `crud.fx`).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+LOCK_DIR = Path("tmp/locks")
+LOCK_FILES = 64  # keys hashed into a fixed set of lock files
+POLL_S = 0.05
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def key(*parts: Any) -> str:
+    return "|".join(str(x) for x in parts)
+
+
+@contextlib.asynccontextmanager
+async def file_lock(key: str) -> AsyncIterator[None]:
+    """Cross-process lock, polled so it does not block event loop."""
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    n = int(hashlib.sha1(key.encode()).hexdigest(), 16) % LOCK_FILES
+    with open(LOCK_DIR / f"{n}.lock", "w") as f:
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(POLL_S)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def _locked(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    async with file_lock(key):
+        return await fn()
+
+
+async def do(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Run `fn()` once per `key` at a time, everyone gets the same result."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_locked(key, fn))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield -> cancelled caller does not cancel fetch for the others
+    return await asyncio.shield(task)
@@ -0,0 +1,375 @@
+"""
+Observation store, one row per (source, base, currency, freq, ts).
+
+Next to observations we keep "coverage" = date spans already fetched from upstream,
+so weekends/bank holidays (no observation at all) are not mistaken for gaps.
+Fetchers ask `plan()` what is missing, fetch only that and build their response
+from `load()`, which reads a memory-mapped columnar snapshot (see `snapshot()`),
+hot ranges straight from memory (see `crud.frames`).
+"""
+from __future__ import annotations
+
+import datetime as dt
+import functools
+import os
+import sqlite3
+import time
+import uuid
+from collections.abc import Iterable
+from collections.abc import Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import structlog
+
+import crud.cache
+import crud.frames
+from config import settings
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+log = structlog.get_logger()
+
+Span = tuple[str, str]  # (YYYY-MM-DD, YYYY-MM-DD), both inclusive
+ONE_DAY = dt.timedelta(days=1)
+COLS = ["currency", "freq", "ts", "value", "source"]
+FRAMES_DIR = Path("tmp/frames")
+
+
+def _schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS observations (
+            source TEXT NOT NULL,
+            base TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            freq TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (source, base, currency, freq, ts)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS coverage (
+            source TEXT NOT NULL,
+            base TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            freq TEXT NOT NULL,
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            expires_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS coverage_key
+            ON coverage (source, base, currency, freq);
+        CREATE TABLE IF NOT EXISTS revisions (
+            source TEXT NOT NULL,
+            base TEXT NOT NULL,
+            rev INTEGER NOT NULL,
+            PRIMARY KEY (source, base)
+        );
+        """
+    )
+
+
+def connect() -> sqlite3.Connection:
+    return crud.cache.connect_local(_schema)
+
+
+def closed_until() -> str:
+    """Last day of the last closed month, data up to it wont change anymore."""
+    import pendulum
+
+    now = pendulum.now(tz="UTC").subtract(days=settings.CACHE_GRACE_DAYS)
+    return now.start_of("month").subtract(days=1).format("YYYY-MM-DD")
+
+
+def _day(s: str) -> dt.date:
+    return dt.date.fromisoformat(s)
+
+
+def merge(spans: Iterable[Span]) -> list[Span]:
+    """Merge overlapping and adjacent spans."""
+    out: list[list[dt.date]] = []
+    for a, b in sorted((_day(a), _day(b)) for a, b in spans):
+        if out and a <= out[-1][1] + ONE_DAY:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return [(a.isoformat(), b.isoformat()) for a, b in out]
+
+
+def subtract(span: Span, covered: Iterable[Span]) -> list[Span]:
+    """Parts of `span` not in `covered`."""
+    cursor, end = _day(span[0]), _day(span[1])
+    gaps: list[tuple[dt.date, dt.date]] = []
+    for a_, b_ in merge(covered):
+        a, b = _day(a_), _day(b_)
+        if b < cursor:
+            continue
+        if a > end:
+            break
+        if a > cursor:
+            gaps.append((cursor, a - ONE_DAY))
+        cursor = b + ONE_DAY
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return [(a.isoformat(), b.isoformat()) for a, b in gaps]
+
+
+def covered(source: str, currency: str, freq: str) -> list[Span]:
+    rows = connect().execute(
+        "SELECT date_from, date_to FROM coverage"
+        " WHERE source = ? AND base = ? AND currency = ? AND freq = ?"
+        " AND (expires_at IS NULL OR expires_at > ?)",
+        (source, settings.BASE, currency, freq, time.time()),
+    )
+    return merge(rows.fetchall())
+
+
+def plan(
+    source: str,
+    currencies: Sequence[str],
+    freqs: Sequence[str],
+    date_from: str,
+    date_to: str,
+) -> list[tuple[tuple[str, ...], Span]]:
+    """
+    What has to be fetched from upstream, as [(currencies, span), ...].
+
+    Gaps of all currencies are merged into contiguous spans, so each span is a
+    single upstream call (for currencies missing at least part of it).
+    """
+    gaps = {
+        currency: [
+            gap
+            for freq in freqs
+            for gap in subtract((date_from, date_to), covered(source, currency, freq))
+        ]
+        for currency in currencies
+    }
+
+    todo = []
+    for a, b in merge(gap for lst in gaps.values() for gap in lst):
+        who = tuple(c for c in currencies if any(x <= b and a <= y for x, y in gaps[c]))
+        todo.append((who, (a, b)))
+    return todo
+
+
+def save(
+    df: pd.DataFrame,
+    source: str,
+    currencies: Sequence[str],
+    freqs: Sequence[str],
+    span: Span,
+) -> None:
+    """
+    Store observations (normalized DF) + mark `span` as fetched. Call only with
+    what upstream really sent, an empty DF marks the span as having no data.
+    """
+    conn = connect()
+    rows = (
+        (source, settings.BASE, cur, freq, ts, value)
+        for cur, freq, ts, value in df.loc[
+            :, ["currency", "freq", "ts", "value"]
+        ].itertuples(index=False, name=None)
+    )
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        for currency in currencies:
+            for freq in freqs:
+                _mark(conn, source, currency, freq, span)
+        if len(df):
+            # invalidates columnar snapshot
+            conn.execute(
+                "INSERT INTO revisions VALUES (?, ?, 1)"
+                " ON CONFLICT (source, base) DO UPDATE SET rev = rev + 1",
+                (source, settings.BASE),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    if len(df) and (l1 := crud.frames.cache()) is not None:
+        l1.invalidate(source)
+
+
+def _mark(conn, source: str, currency: str, freq: str, span: Span) -> None:
+    """
+    Closed part of span is covered forever (merged with what is there already),
+    the open part (current month) only for `CACHE_TTL_OPEN_S`.
+    """
+    key = (source, settings.BASE, currency, freq)
+    date_from, date_to = span
+    closed = closed_until()
+
+    conn.execute(
+        "DELETE FROM coverage WHERE source = ? AND base = ? AND currency = ?"
+        " AND freq = ? AND expires_at <= ?",
+        key + (time.time(),),
+    )
+
+    if date_from <= closed:
+        rows = conn.execute(
+            "SELECT date_from, date_to FROM coverage WHERE source = ? AND base = ?"
+            " AND currency = ? AND freq = ? AND expires_at IS NULL",
+            key,
+        ).fetchall()
+        conn.execute(
+            "DELETE FROM coverage WHERE source = ? AND base = ? AND currency = ?"
+            " AND freq = ? AND expires_at IS NULL",
+            key,
+        )
+        conn.executemany(
+            "INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, NULL)",
+            (key + x for x in merge(rows + [(date_from, min(date_to, closed))])),
+        )
+
+    if date_to > closed:
+        open_from = max(date_from, (_day(closed) + ONE_DAY).isoformat())
+        conn.execute(
+            "INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?)",
+            key + (open_from, date_to, time.time() + settings.CACHE_TTL_OPEN_S),
+        )
+
+
+def expire_open(source: str) -> None:
+    """Forget not yet closed coverage of `source`, next `plan()` refetches it."""
+    connect().execute(
+        "DELETE FROM coverage WHERE source = ? AND base = ? AND expires_at IS NOT NULL",
+        (source, settings.BASE),
+    )
+
+
+def revision(source: str) -> int:
+    row = (
+        connect()
+        .execute(
+            "SELECT rev FROM revisions WHERE source = ? AND base = ?",
+            (source, settings.BASE),
+        )
+        .fetchone()
+    )
+    return row[0] if row else 0
+
+
+def snapshot(source: str, rev: int | None = None) -> np.ndarray:
+    """
+    All observations of `source` as one columnar (structured) numpy array,
+    sorted by freq, currency, ts. Saved as .npy per store revision and
+    memory-mapped, so a cache hit does not parse anything.
+    """
+    if rev is None:
+        rev = revision(source)
+    path = FRAMES_DIR / f"{source}-{settings.BASE}-{rev}.npy"
+    if not path.exists():
+        _write_snapshot(source, rev, path)
+    try:
+        return _mmap(path)
+    except FileNotFoundError:
+        # store moved on meanwhile and other worker cleaned it up, build again
+        _write_snapshot(source, rev, path)
+        return _mmap(path)
+
+
+@functools.lru_cache(maxsize=32)
+def _mmap(path: Path) -> np.ndarray:
+    import numpy as np
+
+    return np.load(path, mmap_mode="r")
+
+
+def _write_snapshot(source: str, rev: int, path: Path) -> None:
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_sql_query(
+        "SELECT currency, freq, ts, value FROM observations"
+        " WHERE source = ? AND base = ? ORDER BY freq, currency, ts",
+        connect(),
+        params=[source, settings.BASE],
+    )
+    arr = np.rec.fromarrays(
+        [
+            df["currency"].to_numpy(dtype="S"),
+            df["freq"].to_numpy(dtype="S"),
+            df["ts"].to_numpy(dtype="S"),
+            df["value"].to_numpy(dtype="f8"),
+        ],
+        names=["currency", "freq", "ts", "value"],
+    )
+
+    FRAMES_DIR.mkdir(parents=True, exist_ok=True)
+    part = path.with_name(f".{uuid.uuid4().hex}.npy")
+    np.save(part, arr.view(np.ndarray))
+    os.replace(part, path)  # atomic, other worker may be doing the same
+    # only older revisions, newer ones other workers may be just about to map
+    prefix = f"{source}-{settings.BASE}-"
+    for old in FRAMES_DIR.glob(f"{prefix}*.npy"):
+        old_rev = old.stem.removeprefix(prefix)
+        if old_rev.isdigit() and int(old_rev) < rev:
+            old.unlink(missing_ok=True)
+
+
+def load(
+    source: str,
+    currencies: Sequence[str],
+    freqs: Sequence[str],
+    date_from: str,
+    date_to: str,
+) -> pd.DataFrame:
+    """Observations in range as DF: currency, freq, ts, value, source."""
+    rev = revision(source)
+    l1 = crud.frames.cache()
+    if l1 is None:
+        return _load(
+            snapshot(source, rev), source, currencies, freqs, date_from, date_to
+        )
+
+    key = crud.frames.key(source, currencies, freqs, date_from, date_to)
+    if (df := l1.get(key, rev)) is not None:
+        return df
+    df = _load(snapshot(source, rev), source, currencies, freqs, date_from, date_to)
+    l1.put(key, rev, df)
+    return df
+
+
+def _load(
+    arr: np.ndarray,
+    source: str,
+    currencies: Sequence[str],
+    freqs: Sequence[str],
+    date_from: str,
+    date_to: str,
+) -> pd.DataFrame:
+    import numpy as np
+    import pandas as pd
+
+    wanted = np.array([c.encode() for c in currencies], dtype="S")
+    frames = []
+    for freq in sorted(freqs):  # same order for any order asked (see crud.frames.key)
+        # monthly ts is YYYY-MM, compare on the same length
+        n = 7 if freq == "M" else 10
+        sub = arr[
+            (arr["freq"] == freq.encode())
+            & (arr["ts"] >= date_from[:n].encode())
+            & (arr["ts"] <= date_to[:n].encode())
+            & np.isin(arr["currency"], wanted)
+        ]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "currency": sub["currency"].astype(str).astype(object),
+                    "freq": sub["freq"].astype(str).astype(object),
+                    "ts": sub["ts"].astype(str).astype(object),
+                    "value": sub["value"],
+                    "source": source,
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=COLS)
+    return pd.concat(frames, ignore_index=True)
@@ -48,7 +48,7 @@ def main():
       web:
         build:
           context: .
-        command: gunicorn main:app --bind 0.0.0.0:5000 -k uvicorn.workers.UvicornWorker
+        command: gunicorn main:app -c gunicorn.conf.py
         restart: always
         ports:
           - "500:5000"
@@ -0,0 +1,94 @@
+"""
+Exported files (workbooks) in tmp/, kept within size and age limits.
+
+Least recently used (made, reused or downloaded, see `touch`) go first, age
+counts from last use too. Files being written are hidden temp files
+(".<uuid>.<name>", see `fx.export.write_xlsx`), those are never evicted, only
+leftovers of crashed writes get removed on startup.
+"""
+from __future__ import annotations
+
+import contextlib
+import os
+import time
+from pathlib import Path
+
+import structlog
+
+from config import settings
+
+log = structlog.get_logger()
+
+TMP = Path("tmp")
+SUFFIXES = (".xlsx",)  # batch ZIPs are streamed, never written here
+STALE_PART_S = 60 * 60  # unfinished write older than this = crashed
+
+
+def path(fname: str) -> Path | None:
+    """Managed file by name, None if there is no such (or name is fishy)."""
+    p = TMP / fname
+    if p.name != fname or fname.startswith(".") or not fname.endswith(SUFFIXES):
+        return None
+    return p if p.is_file() else None
+
+
+def touch(p: Path) -> None:
+    """Mark as used now (atime), keep mtime as it is for Last-Modified."""
+    try:
+        os.utime(p, ns=(time.time_ns(), p.stat().st_mtime_ns))
+    except FileNotFoundError:
+        pass
+
+
+def files() -> list[Path]:
+    return [
+        p for p in TMP.iterdir() if not p.name.startswith(".") and p.suffix in SUFFIXES
+    ]
+
+
+def enforce(keep: Path | None = None) -> None:
+    """
+    Drop files unused for ARTIFACTS_MAX_AGE_S, then LRU over ARTIFACTS_MAX_BYTES.
+    `keep` (just made or reused, link is on its way to user) stays anyway.
+    """
+    now = time.time()
+    entries = []
+    for p in files():
+        if p == keep:
+            continue
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue  # other worker was faster
+        used = max(st.st_atime, st.st_mtime)  # `touch` sets atime
+        if now - used > settings.ARTIFACTS_MAX_AGE_S:
+            p.unlink(missing_ok=True)
+            log.info("artifact expired", filename=p.name)
+        else:
+            entries.append((used, st.st_size, p))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None:
+        with contextlib.suppress(FileNotFoundError):
+            total += keep.stat().st_size  # counts, but is not a candidate
+    for _, size, p in sorted(entries, key=lambda x: x[0]):
+        if total <= settings.ARTIFACTS_MAX_BYTES:
+            break
+        p.unlink(missing_ok=True)
+        total -= size
+        log.info("artifact evicted", filename=p.name, size=total)
+
+
+def reconcile() -> None:
+    """On startup: remove leftovers of crashed writes, then enforce limits."""
+    TMP.mkdir(exist_ok=True)
+    now = time.time()
+    for p in TMP.glob(".*"):
+        if (
+            p.is_file()
+            and p.suffix in SUFFIXES
+            and now - p.stat().st_mtime > STALE_PART_S
+        ):
+            p.unlink(missing_ok=True)
+            log.info("stale partial artifact removed", filename=p.name)
+    enforce()
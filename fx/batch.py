@@ -0,0 +1,183 @@
+"""
+Batch export: many (range, sources) specs in one call, one ZIP of workbooks.
+
+Data for all of them are fetched once (union of ranges and sources, see
+`fx.routes.batch`). Each workbook then gets its data exactly like a single
+export would (`crud.fx.get_all`, routed for its own sources), which is all
+store hits by then. It is transformed and written in a process pool (all
+cores) and goes into the ZIP as soon as it is done. The ZIP is streamed
+meanwhile, nothing waits for the slowest workbook.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import zipfile
+from collections.abc import AsyncIterator
+from collections.abc import Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Literal
+
+import structlog
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+import crud.fx
+import fx.artifacts
+import fx.cross
+import fx.export
+import fx.forms
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = structlog.get_logger()
+
+_pool: concurrent.futures.ProcessPoolExecutor | None = None
+_pid: int | None = None
+
+
+class Spec(BaseModel):
+    """One workbook of a batch."""
+
+    date_from: str  # YYYY-MM-DD
+    date_to: str  # YYYY-MM-DD
+    sources: list[Literal["ecb", "apilayer", "investiny"]] = [
+        "ecb",
+        "apilayer",
+        "investiny",
+    ]
+    pairs: str = ""  # cross rates, "USD/CZK,GBP/HUF"
+
+
+def pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Processes for transform + Excel, BATCH_PROCESSES (default all cores).
+    Started by forkserver, so they never inherit this workers threads or
+    connections.
+    """
+    global _pool, _pid
+    if _pool is None or _pid != os.getpid():
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=settings.BATCH_PROCESSES or len(os.sched_getaffinity(0)),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        _pid = os.getpid()
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None and _pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def render(fname: Path, df: pd.DataFrame) -> Path:
+    """Transform + write workbook, runs in a pool process."""
+    df_daily, df_spot, df_monthly = fx.forms.transform(df=df)
+    fx.export.write_xlsx(fname, df_daily, df_spot, df_monthly)
+    return fname
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, not seekable buffer; `ZipFile` then streams (data descriptors)."""
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def prepare(
+    df: pd.DataFrame, date_from: str, date_to: str, sources: list[str], pairs: list[str]
+) -> tuple[Path, pd.DataFrame]:
+    """Cross rates added, workbook path (by digest). CPU bound, runs in a thread."""
+    import pandas as pd
+
+    df = pd.concat([df, fx.cross.cross_rates(df, pairs)])
+    digest = fx.export.digest(
+        df, sources=sorted(sources), pairs=pairs, date_from=date_from, date_to=date_to
+    )
+    fname = fx.export.TMP / fx.export.filename(
+        f"{date_from}_{date_to}-{'-'.join(sorted(sources))}", digest
+    )
+    return fname, df
+
+
+async def stream(
+    specs: Sequence[tuple[str, str, list[str], list[str]]]
+) -> AsyncIterator[bytes]:
+    """
+    ZIP with a workbook per spec (date_from, date_to, sources, pairs), in the
+    order they get done. Data should be in store already (see `fx.routes.batch`).
+    Entries are numbered by spec ("01-..."), specs differing only in pairs
+    would have the same name otherwise.
+    """
+    loop = asyncio.get_running_loop()
+    renders: dict[Path, asyncio.Future] = {}  # same workbook asked twice -> once
+
+    async def build(date_from, date_to, sources, pairs) -> Path:
+        df = await crud.fx.get_all(date_from, date_to, sources)
+        fname, df = await asyncio.to_thread(
+            prepare, df, date_from, date_to, sources, pairs
+        )
+        if fname not in renders:
+            if fname.exists():
+                fx.artifacts.touch(fname)
+                renders[fname] = loop.create_future()
+                renders[fname].set_result(fname)
+            else:
+                renders[fname] = loop.run_in_executor(pool(), render, fname, df)
+        return await renders[fname]
+
+    tasks = {
+        asyncio.ensure_future(build(*spec)): (i, spec)
+        for i, spec in enumerate(specs, 1)
+    }
+    width = len(str(settings.BATCH_MAX_SPECS))  # same names whatever the count
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w")
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                i, (date_from, date_to, sources, _) = tasks[task]
+                if (exc := task.exception()) is not None:
+                    name = f"{i:0{width}}-{date_from}_{date_to}-{'-'.join(sources)}"
+                    log.error("batch workbook failed", workbook=name, error=repr(exc))
+                    # user errors (eg. cross pair without rates) say what is wrong
+                    text = exc.detail if isinstance(exc, HTTPException) else repr(exc)
+                    zf.writestr(f"{name}.error.txt", f"{text}\n")
+                    continue
+                fname = task.result()
+                name = f"{i:0{width}}-{fx.export.download_name(fname.name)}"
+                # xlsx is zip already, deflating it again is wasted CPU
+                await asyncio.to_thread(zf.write, fname, name, zipfile.ZIP_STORED)
+            yield sink.take()
+        zf.close()
+        yield sink.take()
+    finally:
+        for task in pending:
+            task.cancel()
+        for future in renders.values():
+            future.cancel()
+        fx.artifacts.enforce()
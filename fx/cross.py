@@ -0,0 +1,129 @@
+"""
+Cross rates from what we already have, no extra upstream calls.
+
+All sources give rates against BASE (BASE/X = how many X for 1 BASE), so
+
+    X/Y = (BASE/Y) / (BASE/X)
+
+Each leg (currency + freq) is taken from a single source, first one in
+CROSS_SOURCE_PRIORITY that has it. Legs are aligned on ts (only dates both
+legs have) and divided as numpy arrays.
+
+A pair asked for, but without rates in any freq (leg not in checked sources),
+is an error (422), rather than a workbook silently without it.
+"""
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+import structlog
+from fastapi import HTTPException
+from fastapi import status
+
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = structlog.get_logger()
+
+COLS = ["currency", "freq", "ts", "value", "source"]
+PAIR = re.compile(r"^[A-Z]{3}/[A-Z]{3}$")
+
+
+def parse_pairs(s: str) -> list[str]:
+    """ "usd/czk, GBP/HUF" -> ["USD/CZK", "GBP/HUF"]"""
+    pairs = [x.strip().upper() for x in s.split(",") if x.strip()]
+    if bad := [x for x in pairs if not PAIR.match(x)]:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"invalid currency pairs: {', '.join(bad)}",
+        )
+    return pairs
+
+
+def _legs(df: pd.DataFrame) -> dict[tuple[str, str], pd.DataFrame]:
+    """(currency, freq) -> DF[ts, value, source] from the preferred source."""
+    priority = {s: i for i, s in enumerate(settings.CROSS_SOURCE_PRIORITY.split(","))}
+    best = (
+        df.loc[:, ["currency", "freq", "source"]]
+        .drop_duplicates()
+        .assign(_prio=lambda x: x["source"].map(priority).fillna(len(priority)))
+        .sort_values("_prio", kind="stable")
+        .drop_duplicates(["currency", "freq"])
+    )
+    chosen = df.merge(best.loc[:, ["currency", "freq", "source"]])
+    return {
+        key: g.loc[:, ["ts", "value", "source"]].drop_duplicates("ts").set_index("ts")
+        for key, g in chosen.groupby(["currency", "freq"], sort=False)
+    }
+
+
+def cross_rates(df: pd.DataFrame, pairs: Iterable[str]) -> pd.DataFrame:
+    """
+    Derived rows for `pairs` ("X/Y"), in the same normalized shape as `df`.
+    422, if some of `pairs` cant be derived at all (see `missing`).
+    """
+    import numpy as np
+    import pandas as pd
+
+    pairs = list(pairs)
+    if not pairs or df.empty:
+        return pd.DataFrame(columns=COLS)
+
+    legs = _legs(df)
+    freqs = df["freq"].unique()
+    frames = []
+    done = set()
+    for pair in pairs:
+        x, y = pair.split("/")
+        for freq in freqs:
+            lx = legs.get((x, freq))
+            ly = legs.get((y, freq))
+            # leg of BASE itself is 1 (BASE/BASE)
+            if x == settings.BASE and ly is not None:
+                lx = ly.assign(value=1.0)
+            if y == settings.BASE and lx is not None:
+                ly = lx.assign(value=1.0)
+            if lx is None or ly is None:
+                continue  # eg. investiny currencies have monthly only
+
+            ts = lx.index.intersection(ly.index).sort_values()
+            if ts.empty:
+                continue
+            done.add(pair)
+            vx = lx["value"].reindex(ts).to_numpy(dtype=float)
+            vy = ly["value"].reindex(ts).to_numpy(dtype=float)
+            sx = lx["source"].reindex(ts).to_numpy(dtype=object)
+            sy = ly["source"].reindex(ts).to_numpy(dtype=object)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "currency": pair,
+                        "freq": freq,
+                        "ts": ts.to_numpy(dtype=object),
+                        "value": np.divide(vy, vx),
+                        "source": np.where(sx == sy, sx, sx + "+" + sy),
+                    }
+                )
+            )
+
+    if missing_ := [pair for pair in pairs if pair not in done]:
+        detail = missing(missing_, {currency for currency, _ in legs})
+        log.warning("cross rates missing", pairs=missing_, detail=detail)
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def missing(pairs: list[str], have: set[str]) -> str:
+    """Why `pairs` cant be derived from currencies we `have`, for the user."""
+    have = have | {settings.BASE}
+    lacking = sorted({c for pair in pairs for c in pair.split("/")} - have)
+    out = f"cannot derive cross rates {', '.join(pairs)}"
+    if lacking:
+        return f"{out}: no rates for {', '.join(lacking)} in checked sources"
+    return f"{out}: legs have no common dates or frequency"
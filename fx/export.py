@@ -0,0 +1,103 @@
+"""
+Excel workbooks in tmp/, content-addressed.
+
+Workbook name carries a digest of everything it was built from (range, sources,
+symbols config and the fetched data itself), so a repeat request with same
+inputs just reuses the file. Writes go to a temp file + rename, so nobody can
+download a half-written workbook.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import re
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+TMP = Path("tmp")
+# bump when transform/workbook layout changes, to not serve old workbooks
+LAYOUT_VERSION = 1
+DIGEST_LEN = 12
+
+
+def digest(df: pd.DataFrame, **inputs) -> str:
+    """Hash of input data `df` + whatever else describes the workbook."""
+    import pandas as pd
+
+    h = hashlib.sha256()
+    meta = inputs | {
+        "layout": LAYOUT_VERSION,
+        "base": settings.BASE,
+        "ecb_symbols": settings.ECB_SYMBOLS,
+        "apilayer_symbols": settings.APILAYER_SYMBOLS,
+        "investiny_symbols": settings.INVESTINY_SYMBOLS,
+    }
+    h.update(json.dumps(meta, sort_keys=True).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:DIGEST_LEN]
+
+
+def filename(stem: str, digest_: str) -> str:
+    return f"{stem}.{digest_}.xlsx"
+
+
+def download_name(fname: str) -> str:
+    """Name for user, without digest: "<stem>.<digest>.xlsx" -> "<stem>.xlsx"."""
+    return re.sub(rf"\.[0-9a-f]{{{DIGEST_LEN}}}(\.xlsx)$", r"\1", fname)
+
+
+def write_xlsx(
+    path: Path,
+    df_daily: pd.DataFrame,
+    df_spot: pd.DataFrame,
+    df_monthly: pd.DataFrame,
+) -> None:
+    import pandas as pd
+
+    # hidden temp file, same dir -> rename is atomic
+    part = path.with_name(f".{uuid.uuid4().hex}.{path.name}")
+    try:
+        with pd.ExcelWriter(str(part)) as writer:
+            df_daily.to_excel(writer, sheet_name="daily", index=False)
+            df_spot.to_excel(writer, sheet_name="spot", index=False)
+            df_monthly.to_excel(writer, sheet_name="monthly", index=False)
+        os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+
+
+# --- machine readable exports, streamed without temp files ---
+
+CHUNK_ROWS = 10_000
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_csv(df: pd.DataFrame, chunk: int = CHUNK_ROWS) -> Iterator[str]:
+    yield ",".join(df.columns) + "\n"
+    for i in range(0, len(df), chunk):
+        yield df.iloc[i : i + chunk].to_csv(header=False, index=False)
+
+
+def iter_ndjson(df: pd.DataFrame, chunk: int = CHUNK_ROWS) -> Iterator[str]:
+    for i in range(0, len(df), chunk):
+        yield df.iloc[i : i + chunk].to_json(orient="records", lines=True) + "\n"
+
+
+def to_parquet(df: pd.DataFrame) -> bytes:
+    """Needs pyarrow (optional dependency), raises ImportError if not installed."""
+    buf = io.BytesIO()
+    df.reset_index(drop=True).to_parquet(buf, index=False)
+    return buf.getvalue()
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import functools
+import uuid
 from pathlib import Path
+from typing import TYPE_CHECKING
+from typing import Any
 
-import pandas as pd
-import pendulum
 import structlog
 from fastapi import APIRouter
 from fastapi import Form
@@ -14,8 +16,17 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 import alerting
-import crud.cache
 import crud.fx
+import crud.monthly
+import crud.quota
+import fx.artifacts
+import fx.cross
+import fx.export
+import fx.jobs
+import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 log = structlog.get_logger()
 router = APIRouter()
@@ -30,10 +41,12 @@ async def fetch_data_form(
     ecb: bool = Form(False),  # checkbox
     apilayer: bool = Form(False),  # checkbox
     investiny: bool = Form(False),  # checkbox
+    pairs: str = Form(""),  # cross rates, "USD/CZK, GBP/HUF"
 ):
+    import pendulum
 
     # send telegram message
-    if apilayer_remaining := crud.cache.get(key="apilayer_quota"):
+    if apilayer_remaining := crud.quota.get():
         apilayer_remaining = apilayer_remaining.get("remaining")
     msg = (
         "<b>Bea FX app run</b>\n\n"
@@ -63,78 +76,122 @@ async def fetch_data_form(
             detail="date_from must be before date_to",
         )
 
-    dfe = pd.DataFrame()
-    dfa = pd.DataFrame()
-    dfi = pd.DataFrame()
-    if ecb:
-        dfe = crud.fx.get_ecb(date_from=dic["date_from"], date_to=dic["date_to"])
-    if apilayer:
-        dfa = crud.fx.get_apilayer(date_from=dic["date_from"], date_to=dic["date_to"])
-    if investiny:
-        dfi = crud.fx.get_investiny(date_from=dic["date_from"], date_to=dic["date_to"])
-
-    df = pd.concat([dfe, dfa, dfi])
+    sources = {"ecb": ecb, "apilayer": apilayer, "investiny": investiny}
+    if not any(sources.values()):
+        # nothing checked = everything, router picks the cheapest (crud.router)
+        sources = dict.fromkeys(sources, True)
+    cross = fx.cross.parse_pairs(pairs)
+
+    # heavy lifting in a job, browser polls `hx_job` for result
+    user = request.session.setdefault("user", uuid.uuid4().hex)
+    job_id = fx.jobs.submit(
+        user, functools.partial(build_workbook, dic=dic, sources=sources, cross=cross)
+    )
+    context = {"request": request, "job": fx.jobs.get(job_id, user)}
+    return templates.TemplateResponse(name="index/job.jinja", context=context)
+
+
+@router.get("/jobs/{job_id}/", response_class=HTMLResponse)
+async def hx_job(request: Request, job_id: str):
+    """Job progress, or result (download link) when done."""
+    job = fx.jobs.get(job_id, request.session.get("user", ""))
+    if job is None:
+        job = {"id": job_id, "state": "failed", "error": "Export expired, try again."}
+    if job["state"] != "done":
+        context = {"request": request, "job": job}
+        return templates.TemplateResponse(name="index/job.jinja", context=context)
+
+    context = {"request": request, **job["result"]}
+    stale = job["result"]["stale"]
+    headers = {"X-FX-Stale": ",".join(stale)} if stale else None
+    return templates.TemplateResponse(
+        name="index/result.jinja", context=context, headers=headers
+    )
+
+
+async def build_workbook(
+    progress: fx.jobs.Progress,
+    dic: dict[str, str],
+    sources: dict[str, bool],
+    cross: list[str],
+) -> dict[str, Any]:
+    """Fetch, transform, write Excel. Returns context for result template."""
+    import pandas as pd
+
+    progress("fetch")
+    with metrics.STAGE_SECONDS.time(stage="fetch"):
+        df = await crud.fx.get_all(
+            date_from=dic["date_from"],
+            date_to=dic["date_to"],
+            sources=[k for k, v in sources.items() if v],
+        )
     if df.empty:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No data.")
-
-    df_daily, df_spot, df_monthly = transform(df=df)
+    stale = df.attrs["stale"]  # sources we could not refresh
+    df = pd.concat([df, fx.cross.cross_rates(df, cross)])
 
     ending = ""
-    if ecb and apilayer:
+    if sources["ecb"] and sources["apilayer"]:
         ...  # thats OK, we use all
     else:
-        if ecb:
+        if sources["ecb"]:
             ending += "-ecb"
-        if apilayer:
+        if sources["apilayer"]:
             ending += "-apilayer"
-        if investiny:
+        if sources["investiny"]:
             ending += "-investiny"
-    fname = Path("tmp") / f'{dic["date_from"]}_{dic["date_to"]}{ending}.xlsx'
-    with pd.ExcelWriter(str(fname)) as writer:
-        df_daily.to_excel(writer, sheet_name="daily", index=False)
-        df_spot.to_excel(writer, sheet_name="spot", index=False)
-        df_monthly.to_excel(writer, sheet_name="monthly", index=False)
 
-    context = {"request": request, "filename": fname.name}
-    return templates.TemplateResponse(name="index/result.jinja", context=context)
+    # same inputs -> same workbook, no need to do it again
+    digest = fx.export.digest(df, sources=sources, pairs=cross, **dic)
+    fname = fx.export.TMP / fx.export.filename(
+        f'{dic["date_from"]}_{dic["date_to"]}{ending}', digest
+    )
+    if fname.exists():
+        log.info("workbook from cache", filename=fname.name)
+        fx.artifacts.touch(fname)
+    else:
+        await fx.jobs.in_pool(_write_workbook, fname, df, progress)
+        fx.artifacts.enforce(keep=fname)
+
+    return {
+        "filename": fname.name,
+        "label": fx.export.download_name(fname.name),
+        "stale": stale,
+    }
+
+
+def _write_workbook(fname: Path, df: pd.DataFrame, progress: fx.jobs.Progress) -> None:
+    progress("transform")
+    with metrics.STAGE_SECONDS.time(stage="transform"):
+        df_daily, df_spot, df_monthly = transform(df=df)
+    progress("excel")
+    with metrics.STAGE_SECONDS.time(stage="excel"):
+        fx.export.write_xlsx(fname, df_daily, df_spot, df_monthly)
 
 
 def transform(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Returns dataframes (daily, spot, monthly)"""
+    """
+    Returns dataframes (daily, spot, monthly)
+
+    Spot = last daily observation of each month (per currency). Daily are split
+    and sorted once, spot is then just the last row of each (currency, month).
+    """
+    import pandas as pd
 
     COLS = ["currency", "ts", "value", "source"]
     emtpy_df = pd.DataFrame(columns=COLS)
 
-    df_daily = df.copy().query("freq == 'D'")
+    df_daily = df.loc[df["freq"].eq("D"), COLS].sort_values(["currency", "ts"])
+    df_monthly = df.loc[df["freq"].eq("M"), COLS].sort_values(["currency", "ts"])
+
     if not df_daily.empty:
-        df_daily = df_daily.sort_values(["currency", "ts"]).loc[:, COLS]
+        df_spot = crud.monthly.month_end(df_daily)
     else:
+        # return empty DF in correct shape
         df_daily = emtpy_df.copy()
+        df_spot = emtpy_df.copy()
 
-    df_monthly = df.copy().query("freq == 'M'")
-    if not df_monthly.empty:
-        df_monthly = df_monthly.sort_values(["currency", "ts"]).loc[:, COLS]
-    else:
+    if df_monthly.empty:
         df_monthly = emtpy_df.copy()
 
-    df_spot = df.copy().query("freq == 'D'")
-    if not df_spot.empty:
-        df_spot.loc[:, "_dt"] = pd.to_datetime(df_spot.loc[:, "ts"]).values
-        df_spot.loc[:, "_ym"] = df_spot.apply(
-            lambda row: f'{row["currency"]}-{row["_dt"].year}-{row["_dt"].month}',
-            axis=1,
-        )
-        df_spot = (
-            df_spot.sort_values("ts", ascending=False)
-            .drop_duplicates(keep="first", subset="_ym")
-            .sort_values(["currency", "ts"])
-            .loc[:, COLS]
-        )
-        for col in df_spot.columns:
-            if col.startswith("_"):
-                del df_spot[col]
-    else:
-        # return empty DF in correct shape
-        df_spot = emtpy_df.copy()
-
     return df_daily, df_spot, df_monthly
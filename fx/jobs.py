@@ -0,0 +1,181 @@
+"""
+Export jobs: form submit only enqueues, browser polls for progress and result.
+
+Job state lives in the shared SQLite DB, so any worker can answer the poll.
+Jobs run in the worker which accepted them, at most JOBS_WORKERS at a time
+(the rest waits queued), CPU heavy steps in a thread pool of the same size.
+Each user (session) may have JOBS_PER_USER jobs queued or running, finished
+jobs are forgotten after JOBS_TTL_S.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections.abc import Awaitable
+from collections.abc import Callable
+from typing import Any
+
+import structlog
+from fastapi import HTTPException
+from fastapi import status
+
+import alerting
+import crud.cache
+import metrics
+from config import settings
+
+log = structlog.get_logger()
+
+ACTIVE = ("queued", "fetch", "transform", "excel")  # not finished yet
+
+Progress = Callable[[str], None]
+Work = Callable[[Progress], Awaitable[dict[str, Any]]]
+
+_pool: concurrent.futures.ThreadPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+_pid: int | None = None
+_tasks: set[asyncio.Task] = set()
+
+
+def _schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " user TEXT NOT NULL,"
+        " state TEXT NOT NULL,"
+        " result TEXT,"
+        " error TEXT,"
+        " pid INTEGER NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL"
+        ")"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user, state)")
+
+
+def connect() -> sqlite3.Connection:
+    return crud.cache.connect_local(_schema)
+
+
+def pool() -> concurrent.futures.ThreadPoolExecutor:
+    """Threads for pandas/openpyxl work, so event loop keeps serving."""
+    global _pool, _slots, _pid
+    if _pool is None or _pid != os.getpid():
+        _pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.JOBS_WORKERS, thread_name_prefix="job"
+        )
+        _slots = asyncio.Semaphore(settings.JOBS_WORKERS)
+        _pid = os.getpid()
+    return _pool
+
+
+def expire() -> None:
+    conn = connect()
+    conn.execute(
+        "DELETE FROM jobs WHERE updated_at < ?", (time.time() - settings.JOBS_TTL_S,)
+    )
+
+
+def get(job_id: str, user: str) -> dict[str, Any] | None:
+    """Job of `user` as dict (id, state, result, error), None if unknown/expired."""
+    row = (
+        connect()
+        .execute(
+            "SELECT state, result, error, pid, updated_at FROM jobs"
+            " WHERE id = ? AND user = ?",
+            (job_id, user),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    state, result, error, pid, updated_at = row
+    if updated_at < time.time() - settings.JOBS_TTL_S:
+        return None
+    if state in ACTIVE and not metrics.alive(pid):
+        # worker running it is gone (restart, crash)
+        state, error = "failed", "export was interrupted, please try again"
+        _update(job_id, state=state, error=error)
+    return {
+        "id": job_id,
+        "state": state,
+        "result": json.loads(result) if result else None,
+        "error": error,
+    }
+
+
+def _update(job_id: str, **values: Any) -> None:
+    cols = ", ".join(f"{k} = ?" for k in values)
+    connect().execute(
+        f"UPDATE jobs SET {cols}, updated_at = ? WHERE id = ?",
+        (*values.values(), time.time(), job_id),
+    )
+
+
+def submit(user: str, work: Work) -> str:
+    """
+    Enqueue `work(progress)` (returns result dict) for `user`, get job id.
+    429, if user has too many jobs going already.
+    """
+    expire()
+    conn = connect()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    # check + insert in one transaction, so parallel submits cant both pass
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        (active,) = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user = ? AND state IN (?, ?, ?, ?)",
+            (user, *ACTIVE),
+        ).fetchone()
+        if active >= settings.JOBS_PER_USER:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many exports running, wait for them to finish.",
+            )
+        conn.execute(
+            "INSERT INTO jobs (id, user, state, pid, created_at, updated_at)"
+            " VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, user, os.getpid(), now, now),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    task = asyncio.create_task(_run(job_id, work))
+    _tasks.add(task)  # keep reference, else task may be garbage collected
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+async def _run(job_id: str, work: Work) -> None:
+    pool()
+    assert _slots is not None
+    async with _slots:
+        t0 = time.perf_counter()
+        try:
+            result = await work(lambda stage: _update(job_id, state=stage))
+        except HTTPException as exc:
+            _update(job_id, state="failed", error=str(exc.detail))
+            return
+        except Exception as exc:
+            # never reaches main.any_exception, alert here the same way
+            log.exception("export job failed", job_id=job_id)
+            _update(job_id, state="failed", error="Export failed")
+            await alerting.telegram(
+                text=f"<b>Bea FX app exception</b>\n\n{exc!r}\n<i>job: </i>{job_id}"
+            )
+            return
+        _update(job_id, state="done", result=json.dumps(result))
+        log.info("export job done", job_id=job_id, elapsed_s=time.perf_counter() - t0)
+
+
+async def in_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run sync `fn(*args)` in job thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(pool(), fn, *args)
@@ -1,28 +1,250 @@
+from collections.abc import Iterator
+from email.utils import formatdate
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import Literal
 
 import structlog
 from fastapi import APIRouter
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 from fastapi import status
 from fastapi.exceptions import HTTPException
 from fastapi.responses import FileResponse
 from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 import crud.fx
+import fx.artifacts
+import fx.batch
+import fx.cross
+import fx.export
+import fx.forms
+import metrics
+from config import settings
 
 log = structlog.get_logger()
 templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
+MEDIA_TYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
 
 @router.get("/dl/{fname}/", response_class=FileResponse)
-async def download_result(fname: str):
+async def download_result(request: Request, fname: str):
+    """
+    Download exported file. Sends ETag + Last-Modified (-> 304 on repeat)
+    and supports single "Range: bytes=..." (-> 206, resumed downloads).
+    """
 
-    p = Path("tmp") / fname
-    if not p.exists():
+    p = fx.artifacts.path(fname)
+    if p is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found.")
+    fx.artifacts.touch(p)
+
+    st = p.stat()
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": (
+            f'attachment; filename="{fx.export.download_name(fname)}"'
+        ),
+    }
+
+    if if_none_match := request.headers.get("if-none-match"):
+        if (
+            etag in (x.strip() for x in if_none_match.split(","))
+            or if_none_match == "*"
+        ):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    elif if_modified_since := request.headers.get("if-modified-since"):
+        try:
+            if int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+                )
+        except (TypeError, ValueError):
+            pass  # broken date -> ignore
+
+    span = None
+    range_ = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_ and (if_range is None or if_range == etag):
+        try:
+            span = _byte_range(range_, st.st_size)
+        except ValueError:
+            pass  # not a range we serve, whole file then
+        else:
+            if span is None:
+                return Response(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers=headers | {"Content-Range": f"bytes */{st.st_size}"},
+                )
+    if span is not None:
+        start, end = span
+        headers |= {
+            "Content-Range": f"bytes {start}-{end}/{st.st_size}",
+            "Content-Length": str(end - start + 1),
+        }
+        return StreamingResponse(
+            _read(p, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            headers=headers,
+            media_type=MEDIA_TYPE_XLSX,
+        )
+
+    return FileResponse(path=str(p), headers=headers, media_type=MEDIA_TYPE_XLSX)
+
+
+def _byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    "bytes=0-99" | "bytes=100-" | "bytes=-100" -> (start, end), inclusive,
+    None if it is out of file (416). ValueError for what we dont serve (other
+    units, multiple ranges are not worth it, garbage), header is ignored then.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+        if last and end < start:
+            raise ValueError(header)  # invalid, not unsatisfiable
+    else:
+        start, end = size - int(last), size - 1
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+def _read(p: Path, start: int, end: int, chunk: int = 64 * 1024) -> Iterator[bytes]:
+    with p.open("rb") as f:
+        f.seek(start)
+        left = end - start + 1
+        while left > 0 and (data := f.read(min(chunk, left))):
+            left -= len(data)
+            yield data
+
+
+@router.get("/export/")
+async def export(
+    date_from: str,
+    date_to: str,
+    sources: list[Literal["ecb", "apilayer", "investiny"]] = Query(
+        ["ecb", "apilayer", "investiny"]
+    ),
+    kind: Literal["daily", "spot", "monthly"] = "daily",
+    fmt: Literal["csv", "ndjson", "parquet"] = Query("csv", alias="format"),
+    pairs: str = "",
+):
+    """
+    Rates as csv / ndjson (streamed) or parquet, for scripts.
+
+    /fx/export/?date_from=2022-01-01&date_to=2022-09-30&sources=ecb&kind=spot&format=csv
+
+    Optional `pairs` ("USD/CZK,GBP/HUF") adds cross rates.
+    """
+    import pandas as pd
+
+    date_from, date_to = _range(date_from, date_to)
+    df = await crud.fx.get_all(date_from=date_from, date_to=date_to, sources=sources)
+    if df.empty:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No data.")
+    stale = df.attrs["stale"]
+    df = pd.concat([df, fx.cross.cross_rates(df, fx.cross.parse_pairs(pairs))])
+
+    with metrics.STAGE_SECONDS.time(stage="transform"):
+        df_daily, df_spot, df_monthly = fx.forms.transform(df=df)
+    df = {"daily": df_daily, "spot": df_spot, "monthly": df_monthly}[kind]
+
+    fname = f"{date_from}_{date_to}-{kind}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{fname}"'}
+    if stale:
+        # upstream failed, these come from store only (may be old)
+        headers["X-FX-Stale"] = ",".join(stale)
+    media_type = fx.export.MEDIA_TYPES[fmt]
+
+    if fmt == "parquet":
+        try:
+            content = fx.export.to_parquet(df)
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="parquet export needs pyarrow installed",
+            )
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    rows = fx.export.iter_csv(df) if fmt == "csv" else fx.export.iter_ndjson(df)
+    return StreamingResponse(rows, media_type=media_type, headers=headers)
+
+
+def _range(date_from: str, date_to: str) -> tuple[str, str]:
+    """Validated range, date_to not in future (set to today)."""
+    import pendulum
+
+    try:
+        date_from_ = pendulum.from_format(date_from, "YYYY-MM-DD")
+        date_to_ = pendulum.from_format(date_to, "YYYY-MM-DD")
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="dates must be YYYY-MM-DD",
+        )
+    if not date_from_ < date_to_:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="date_from must be before date_to",
+        )
+    # date_to cant be in future –> set it to today
+    return date_from, min(date_to_, pendulum.now(tz="UTC")).format("YYYY-MM-DD")
+
+
+@router.post("/batch/")
+async def batch(specs: list[fx.batch.Spec]):
+    """
+    Many exports at once, as ZIP of workbooks (streamed, each as soon as done).
+
+        curl -X POST localhost:5000/fx/batch/ -o fx.zip -H "Content-Type: application/json" \
+            -d '[{"date_from": "2022-08-01", "date_to": "2022-08-31", "sources": ["ecb"]},
+                 {"date_from": "2022-01-01", "date_to": "2022-09-30"}]'
+
+    Data are fetched once for all of them (union of ranges and sources).
+    """
+    if not 0 < len(specs) <= settings.BATCH_MAX_SPECS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"1 to {settings.BATCH_MAX_SPECS} exports per batch",
+        )
+    jobs = [
+        (
+            *_range(spec.date_from, spec.date_to),
+            sorted(set(spec.sources)),
+            fx.cross.parse_pairs(spec.pairs),
+        )
+        for spec in specs
+    ]
+
+    # everything at once, each workbook then finds its data in store
+    with metrics.STAGE_SECONDS.time(stage="fetch"):
+        df = await crud.fx.get_all(
+            date_from=min(job[0] for job in jobs),
+            date_to=max(job[1] for job in jobs),
+            sources=sorted({source for job in jobs for source in job[2]}),
+        )
+    if df.empty:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No data.")
 
-    return FileResponse(path=str(p), filename=fname)
+    headers = {"Content-Disposition": 'attachment; filename="fx-batch.zip"'}
+    if stale := df.attrs["stale"]:
+        headers["X-FX-Stale"] = ",".join(stale)
+    return StreamingResponse(
+        fx.batch.stream(jobs), media_type="application/zip", headers=headers
+    )
 
 
 @router.get("/investiny/", response_class=JSONResponse)
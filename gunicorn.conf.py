@@ -0,0 +1,46 @@
+"""
+gunicorn config, multi-process mode:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+App is loaded once in master (preload_app) incl. heavy imports, workers are
+forked from it and share that memory copy-on-write. Each worker then makes its
+own HTTP client and SQLite connections.
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Excel for long ranges blocks a worker for a while, dont kill it for that
+timeout = 120
+graceful_timeout = 30
+
+
+def available_cpus() -> int:
+    """CPUs we may use: affinity mask, capped by cgroup (docker --cpus) quota."""
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or available_cpus()
+
+
+def when_ready(server):
+    # runs in master after app was preloaded, before workers are forked
+    import main
+
+    main.preload()
+
+
+def post_fork(server, worker):
+    import main
+
+    main.after_fork()
@@ -1,21 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import importlib
 from pathlib import Path
 
 import structlog
 from fastapi import FastAPI
 from fastapi import Request
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
 import alerting
+import config
+import crud.cache
+import crud.frames
+import crud.http
+import crud.store
+import fx.artifacts
+import fx.batch
+import metrics
+import scheduler
 from config import settings
 from fx.forms import router as fx_forms
 from fx.routes import router as fx_router
 from views.routes import router as views_router
 
 WEEK_S = 7 * 24 * 60 * 60
+# loaded on first use (see crud.fx, fx.forms), or by `warm_imports`
+HEAVY_IMPORTS = ("pandas", "numpy", "pendulum", "openpyxl", "investiny.search")
 Path("tmp").mkdir(exist_ok=True)
 log = structlog.get_logger()
 templates = Jinja2Templates(directory="templates")
@@ -27,11 +41,61 @@ app.add_middleware(
     secret_key=settings.SECRET_KEY.get_secret_value(),
     max_age=WEEK_S,
 )
+app.add_middleware(metrics.Middleware)
 app.include_router(views_router, tags=["views"])
 app.include_router(fx_router, prefix="/fx", tags=["fx"])
 app.include_router(fx_forms, prefix="/fx", tags=["forms"])
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_view():
+    """Prometheus text format, aggregated over all workers."""
+    return metrics.render()
+
+
+def warm_imports() -> None:
+    """Import heavy deps now, so the first form submit does not pay for them."""
+    for name in HEAVY_IMPORTS:
+        importlib.import_module(name)
+
+
+def preload() -> None:
+    """
+    Before forking workers (gunicorn preload_app): heavy imports and symbol
+    tables are done once, workers share them copy-on-write.
+    """
+    warm_imports()
+    config.list_rates(settings.ECB_SYMBOLS, sep="+")
+    config.list_rates(settings.APILAYER_SYMBOLS, sep=",")
+
+
+def after_fork() -> None:
+    """In a fresh worker: never reuse connections made by parent process."""
+    crud.http.reset()
+    crud.cache.reset()
+    crud.frames.reset()
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    fx.artifacts.reconcile()
+    alerting.start()
+    metrics.start()
+    scheduler.start()
+    if settings.WARM_IMPORTS:
+        # in background, app serves meanwhile
+        asyncio.get_running_loop().run_in_executor(None, warm_imports)
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await scheduler.stop()
+    await alerting.flush()
+    await crud.http.aclose()
+    fx.batch.shutdown()
+    await metrics.stop()
+
+
 @app.exception_handler(Exception)
 async def any_exception(request: Request, exc: Exception):
     """
@@ -0,0 +1,226 @@
+"""
+Tiny Prometheus-style metrics (counters, gauges, histograms), text format on /metrics.
+
+Each worker keeps its metrics in memory and dumps them to tmp/metrics/<pid>.json
+(every METRICS_FLUSH_S, on scrape and on shutdown). /metrics sums dumps of all
+workers, so it does not matter which worker gets scraped.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+
+from config import settings
+
+DIR = Path("tmp/metrics")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics: dict[str, Metric] = {}
+_task: asyncio.Task | None = None
+
+
+def _key(labels: dict[str, str]) -> str:
+    return json.dumps(labels, sort_keys=True)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: dict[str, float | dict] = {}
+        _metrics[name] = self
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1, **labels: str) -> None:
+        k = _key(labels)
+        self.values[k] = self.values.get(k, 0) + n
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[_key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def observe(self, value: float, **labels: str) -> None:
+        k = _key(labels)
+        h = self.values.setdefault(
+            k, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        )
+        for i, le in enumerate(BUCKETS):
+            if value <= le:
+                h["buckets"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+    def mean(self, **labels: str) -> float | None:
+        """Mean of observed values (this worker), None if nothing observed yet."""
+        h = self.values.get(_key(labels))
+        if not h or not h["count"]:
+            return None
+        return h["sum"] / h["count"]
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+
+# --- what we measure ---
+
+REQUEST_SECONDS = Histogram("fx_request_seconds", "HTTP request latency per route")
+UPSTREAM_SECONDS = Histogram("fx_upstream_seconds", "Upstream call latency")
+UPSTREAM_ERRORS = Counter("fx_upstream_errors_total", "Failed upstream calls")
+UPSTREAM_RETRIES = Counter("fx_upstream_retries_total", "Retried upstream calls")
+CIRCUIT_OPEN = Gauge("fx_circuit_open", "1 = upstream circuit breaker is open")
+STALE_RESPONSES = Counter("fx_stale_total", "Stored data served, upstream failed")
+STAGE_SECONDS = Histogram("fx_stage_seconds", "Time per pipeline stage")
+STORE_REQUESTS = Counter("fx_store_requests_total", "Store lookups, hit = no fetch")
+CACHE_REQUESTS = Counter("fx_cache_requests_total", "Key-value cache lookups")
+CACHE_BYTES = Counter("fx_cache_bytes_total", "Bytes read/written by cache")
+FRAME_CACHE_REQUESTS = Counter("fx_frame_cache_requests_total", "In-memory DF lookups")
+FRAME_CACHE_BYTES = Gauge("fx_frame_cache_bytes", "Memory used by in-memory DFs")
+ROUTED_CELLS = Counter("fx_routed_cells_total", "(currency, freq, month) per source")
+CACHE_RAW_BYTES = Counter("fx_cache_raw_bytes_total", "Cache bytes before compression")
+CACHE_DECODE_SECONDS = Histogram("fx_cache_decode_seconds", "Cache value decoding")
+MONTHLY_CHECKS = Counter("fx_monthly_checks_total", "Derived vs official monthly")
+APILAYER_QUOTA = Gauge("fx_apilayer_quota_remaining", "Apilayer calls left")
+
+
+class Middleware:
+    """ASGI middleware timing requests per route (endpoint name, not path)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint = scope.get("endpoint")  # set by router
+            route = getattr(endpoint, "__name__", "other")
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, route=route)
+
+
+# --- multi worker ---
+
+
+def dump() -> None:
+    """Write this workers metrics for others to aggregate."""
+    DIR.mkdir(parents=True, exist_ok=True)
+    state = {m.name: m.values for m in _metrics.values()}
+    part = DIR / f".{uuid.uuid4().hex}.json"
+    part.write_text(json.dumps({"ts": time.time(), "metrics": state}))
+    os.replace(part, DIR / f"{os.getpid()}.json")
+
+
+def alive(pid: int) -> bool:
+    """Process `pid` still runs (any user's)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merged() -> dict[str, dict[str, float | dict]]:
+    dumps = []
+    for p in DIR.glob("[0-9]*.json"):
+        if not alive(int(p.stem)):
+            p.unlink(missing_ok=True)
+            continue
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            dumps.append(json.loads(p.read_text()))
+
+    merged: dict[str, dict[str, float | dict]] = {name: {} for name in _metrics}
+    # oldest first, so newest gauge value wins
+    for d in sorted(dumps, key=lambda x: x["ts"]):
+        for name, values in d["metrics"].items():
+            if name not in _metrics:
+                continue
+            out = merged[name]
+            for k, v in values.items():
+                if _metrics[name].kind == "gauge" or k not in out:
+                    out[k] = v
+                elif _metrics[name].kind == "counter":
+                    out[k] += v
+                else:
+                    out[k] = {
+                        "buckets": [
+                            a + b for a, b in zip(out[k]["buckets"], v["buckets"])
+                        ],
+                        "sum": out[k]["sum"] + v["sum"],
+                        "count": out[k]["count"] + v["count"],
+                    }
+    return merged
+
+
+def _labels(k: str, **extra: str) -> str:
+    labels = json.loads(k) | extra
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{a}="{b}"' for a, b in labels.items()) + "}"
+
+
+def render() -> str:
+    """All workers metrics in Prometheus text format."""
+    dump()
+    lines = []
+    for name, values in _merged().items():
+        m = _metrics[name]
+        lines += [f"# HELP {name} {m.help}", f"# TYPE {name} {m.kind}"]
+        for k, v in values.items():
+            if m.kind != "histogram":
+                lines.append(f"{name}{_labels(k)} {v}")
+                continue
+            for le, n in zip(BUCKETS, v["buckets"]):
+                lines.append(f"{name}_bucket{_labels(k, le=str(le))} {n}")
+            lines.append(f'{name}_bucket{_labels(k, le="+Inf")} {v["count"]}')
+            lines.append(f"{name}_sum{_labels(k)} {v['sum']}")
+            lines.append(f"{name}_count{_labels(k)} {v['count']}")
+    return "\n".join(lines) + "\n"
+
+
+async def _loop() -> None:
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_S)
+        dump()
+
+
+def start() -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _task
+        _task = None
+    dump()
@@ -0,0 +1,119 @@
+"""
+Cache warming: prefetch current + previous month for all sources at given times,
+so the first user of the day does not wait for upstream.
+
+Every worker runs the loop, but only the one holding `tmp/warm.lock` (flock)
+does the work. If it dies, lock is released and another worker takes over.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import time
+from typing import IO
+from typing import TYPE_CHECKING
+
+import structlog
+
+import crud.fx
+import crud.quota
+import crud.store
+from config import settings
+
+if TYPE_CHECKING:
+    import pendulum
+
+log = structlog.get_logger()
+
+LOCK_PATH = "tmp/warm.lock"
+
+_task: asyncio.Task | None = None
+_lock: IO | None = None
+
+
+def is_leader() -> bool:
+    """Try to become (or stay) the warming worker."""
+    global _lock
+    if _lock is not None:
+        return True
+    f = open(LOCK_PATH, "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    _lock = f
+    return True
+
+
+def next_run(now: pendulum.DateTime) -> pendulum.DateTime:
+    """Next of WARM_TIMES ("HH:MM,HH:MM", UTC) after `now`."""
+    runs = []
+    for hhmm in settings.WARM_TIMES.split(","):
+        hour, minute = (int(x) for x in hhmm.strip().split(":"))
+        run = now.set(hour=hour, minute=minute, second=0, microsecond=0)
+        runs.append(run if run > now else run.add(days=1))
+    return min(runs)
+
+
+async def warm() -> None:
+    import pendulum
+
+    now = pendulum.now(tz="UTC")
+    date_from = now.subtract(months=1).start_of("month").format("YYYY-MM-DD")
+    date_to = now.format("YYYY-MM-DD")
+    logger = log.bind(date_from=date_from, date_to=date_to)
+
+    for source in settings.WARM_SOURCES.split(","):
+        if source == "apilayer":
+            quota = crud.quota.get() or {}
+            if quota.get("remaining", settings.WARM_APILAYER_MIN_QUOTA) < (
+                settings.WARM_APILAYER_MIN_QUOTA
+            ):
+                logger.warning("cache warming skipped, low quota", source=source)
+                continue
+
+        t0 = time.perf_counter()
+        crud.store.expire_open(source)  # we are here for fresh data
+        try:
+            df = await crud.fx.FETCHERS[source](date_from=date_from, date_to=date_to)
+        except Exception as exc:
+            logger.error("cache warming failed", source=source, errors=repr(exc))
+            continue
+        logger.info(
+            "cache warmed",
+            source=source,
+            rows=len(df),
+            stale=df.attrs.get("stale", False),
+            elapsed_s=round(time.perf_counter() - t0, 3),
+        )
+
+
+async def _loop() -> None:
+    import pendulum
+
+    while True:
+        now = pendulum.now(tz="UTC")
+        run = next_run(now)
+        await asyncio.sleep((run - now).total_seconds())
+        if is_leader():
+            await warm()
+
+
+def start() -> None:
+    global _task
+    if settings.WARM_ENABLED and _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop() -> None:
+    global _task, _lock
+    if _task is not None:
+        _task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _task
+        _task = None
+    if _lock is not None:
+        _lock.close()  # releases flock
+        _lock = None
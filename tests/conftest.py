@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+# settings need it at import, tests never call apilayer
+os.environ.setdefault("APILAYER_API_KEY", "test")
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Empty tmp/ (cache, store, jobs) as working dir, fresh connections to it."""
+    import crud.cache
+    import crud.frames
+    import crud.http
+    import crud.quota
+
+    def reset():
+        crud.cache.reset()
+        crud.frames.reset()
+        crud.http.reset()
+        crud.quota._snapshot, crud.quota._loaded_at = None, None
+
+    (tmp_path / "tmp").mkdir()
+    monkeypatch.chdir(tmp_path)
+    reset()
+    yield tmp_path
+    reset()
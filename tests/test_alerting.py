@@ -0,0 +1,54 @@
+"""`alerting`: bursts are collapsed and capped before they reach Telegram."""
+import asyncio
+
+import pytest
+
+import alerting
+from config import settings
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Texts passed to Telegram."""
+    out: list[str] = []
+
+    async def send(text):
+        out.append(text)
+
+    monkeypatch.setattr(alerting, "_send", send)
+    monkeypatch.setattr(settings, "TELEGRAM_ENABLED", True)
+    monkeypatch.setattr(settings, "TELEGRAM_MIN_INTERVAL_S", 0)
+    monkeypatch.setattr(settings, "TELEGRAM_BATCH_MAX", 3)
+    monkeypatch.setattr(alerting, "_queue", None)
+    monkeypatch.setattr(alerting, "_worker", None)
+    monkeypatch.setattr(alerting, "_dropped", 0)
+    alerting._pending.clear()
+    return out
+
+
+def burst(texts):
+    async def main():
+        for text in texts:
+            await alerting.telegram(text)
+        await alerting.flush()
+
+    asyncio.run(main())
+
+
+def test_identical_collapsed(sent):
+    burst(["boom"] * 4 + ["bang"])
+    assert sent == ["boom\n\n<i>4x</i>", "bang"]
+
+
+def test_distinct_capped(sent):
+    burst(["a", "a"] + [f"error {i}" for i in range(10)])
+    assert len(sent) == 4
+    assert sent[0] == "a\n\n<i>2x</i>"  # most frequent first
+    assert sent[-1] == "<i>8 more alerts suppressed</i>"
+    assert not alerting._pending
+
+
+def test_dropped_reported(sent, monkeypatch):
+    monkeypatch.setattr(settings, "TELEGRAM_QUEUE_SIZE", 2)
+    burst(["a", "b", "c", "d"])
+    assert sent == ["a\n<i>+2 dropped</i>", "b"]
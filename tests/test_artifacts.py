@@ -0,0 +1,51 @@
+"""`fx.artifacts.enforce`: age and size limits go by last use, `keep` stays."""
+import os
+import time
+
+import fx.artifacts
+from config import settings
+
+DAY = 24 * 60 * 60
+
+
+def workbook(name: str, size: int, used_days_ago: float, made_days_ago: float):
+    p = fx.artifacts.TMP / name
+    p.write_bytes(b"x" * size)
+    now = time.time()
+    os.utime(p, (now - used_days_ago * DAY, now - made_days_ago * DAY))
+    return p
+
+
+def test_age_from_last_use(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_S", 7 * DAY)
+    reused = workbook("reused.xlsx", 10, used_days_ago=1, made_days_ago=30)
+    unused = workbook("unused.xlsx", 10, used_days_ago=30, made_days_ago=30)
+    fx.artifacts.enforce()
+    assert reused.exists()
+    assert not unused.exists()
+
+
+def test_touch_keeps_mtime(workdir):
+    p = workbook("a.xlsx", 10, used_days_ago=30, made_days_ago=30)
+    mtime = p.stat().st_mtime
+    fx.artifacts.touch(p)
+    assert p.stat().st_mtime == mtime
+    assert time.time() - p.stat().st_atime < 60
+
+
+def test_keep_never_evicted(workdir, monkeypatch):
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_AGE_S", 7 * DAY)
+    monkeypatch.setattr(settings, "ARTIFACTS_MAX_BYTES", 25)
+    old = workbook("old.xlsx", 10, used_days_ago=30, made_days_ago=30)
+    lru = workbook("lru.xlsx", 10, used_days_ago=3, made_days_ago=3)
+    mru = workbook("mru.xlsx", 10, used_days_ago=2, made_days_ago=2)
+    fx.artifacts.enforce(keep=old)
+    assert old.exists()  # too old and least recently used, but kept
+    assert not lru.exists()  # 30 bytes > 25, first of the rest
+    assert mru.exists()
+
+
+def test_only_workbooks(workdir):
+    (fx.artifacts.TMP / "batch.zip").write_bytes(b"x")
+    assert fx.artifacts.files() == []
+    assert fx.artifacts.path("batch.zip") is None
@@ -0,0 +1,61 @@
+"""SQLite connections (`connect_local`) and cache entries."""
+import threading
+
+import pytest
+
+import crud.cache
+
+
+def schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS t (x)")
+
+
+def other(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS u (x)")
+
+
+def test_connect_local(workdir):
+    conn = crud.cache.connect_local(schema)
+    assert crud.cache.connect_local(schema) is conn
+    conn.execute("INSERT INTO t VALUES (1)")
+
+    assert crud.cache.connect_local(other) is not conn  # own schema, own conn
+    (n,) = crud.cache.connect_local(other).execute("SELECT COUNT(*) FROM t").fetchone()
+    assert n == 1  # same DB
+
+    in_thread = []
+    thread = threading.Thread(
+        target=lambda: in_thread.append(crud.cache.connect_local(schema))
+    )
+    thread.start()
+    thread.join()
+    assert in_thread[0] is not conn
+
+    crud.cache.reset()
+    assert crud.cache.connect_local(schema) is not conn
+
+
+def test_roundtrip(workdir):
+    crud.cache.create(key="k", obj={"a": [1, 2] * 1000})
+    assert crud.cache.get("k") == {"a": [1, 2] * 1000}
+    assert crud.cache.get("missing") is None
+
+
+@pytest.mark.parametrize(
+    "codec, value",
+    [
+        ("zstd", b"\x28\xb5\x2f\xfd"),  # written where zstandard is installed
+        ("zlib", b"not zlib at all"),
+        ("none", b"not a pickle"),
+    ],
+)
+def test_unreadable_is_miss(workdir, monkeypatch, codec, value):
+    monkeypatch.delitem(crud.cache.CODECS, "zstd", raising=False)  # not here
+    conn = crud.cache.backend().connect()
+    conn.execute(
+        "INSERT INTO cache (key, value, size, expires_at, accessed_at, codec)"
+        " VALUES ('k', ?, ?, NULL, 0, ?)",
+        (value, len(value), codec),
+    )
+    assert crud.cache.get("k") is None
+    assert conn.execute("SELECT COUNT(*) FROM cache").fetchone() == (0,)
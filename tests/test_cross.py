@@ -0,0 +1,66 @@
+"""`fx.cross.cross_rates`: X/Y = (BASE/Y) / (BASE/X), missing legs are an error."""
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+import fx.cross
+
+ROWS = [
+    # currency, freq, ts, value, source; BASE = EUR
+    ("USD", "D", "2022-01-03", 1.25, "ecb"),
+    ("USD", "D", "2022-01-04", 1.0, "ecb"),
+    ("CZK", "D", "2022-01-03", 25.0, "ecb"),
+    ("CZK", "D", "2022-01-04", 24.0, "ecb"),
+    ("CZK", "D", "2022-01-05", 23.0, "ecb"),  # no USD that day
+    ("USD", "M", "2022-01", 1.2, "ecb"),
+    ("RSD", "M", "2022-01", 120.0, "investiny"),  # monthly only
+]
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(ROWS, columns=fx.cross.COLS)
+
+
+def values(out, pair, freq="D"):
+    rows = out.loc[out["currency"].eq(pair) & out["freq"].eq(freq)]
+    return dict(zip(rows["ts"], rows["value"]))
+
+
+def test_both_legs(df):
+    out = fx.cross.cross_rates(df, ["USD/CZK"])
+    assert values(out, "USD/CZK") == {"2022-01-03": 20.0, "2022-01-04": 24.0}
+    assert set(out["source"]) == {"ecb"}
+
+
+def test_inverse(df):
+    out = fx.cross.cross_rates(df, ["USD/CZK", "CZK/USD"])
+    direct, inverse = values(out, "USD/CZK"), values(out, "CZK/USD")
+    assert inverse == pytest.approx({ts: 1 / v for ts, v in direct.items()})
+
+
+def test_base_leg(df):
+    out = fx.cross.cross_rates(df, ["EUR/USD", "USD/EUR"])
+    assert values(out, "EUR/USD") == {"2022-01-03": 1.25, "2022-01-04": 1.0}
+    assert values(out, "USD/EUR") == {"2022-01-03": 0.8, "2022-01-04": 1.0}
+
+
+def test_one_freq_is_enough(df):
+    out = fx.cross.cross_rates(df, ["USD/RSD"])
+    assert values(out, "USD/RSD", "M") == {"2022-01": 100.0}
+    assert values(out, "USD/RSD", "D") == {}
+    assert set(out["source"]) == {"ecb+investiny"}
+
+
+def test_leg_missing(df):
+    with pytest.raises(HTTPException) as exc:
+        fx.cross.cross_rates(df, ["USD/CZK", "USD/HUF", "GBP/CZK"])
+    assert exc.value.status_code == 422
+    assert "USD/HUF, GBP/CZK" in exc.value.detail
+    assert "no rates for GBP, HUF" in exc.value.detail
+
+
+def test_no_common_freq(df):
+    with pytest.raises(HTTPException) as exc:
+        fx.cross.cross_rates(df, ["CZK/RSD"])
+    assert "no common" in exc.value.detail
@@ -0,0 +1,120 @@
+"""`/fx/dl/` conditional (304) and range (206, 416) requests."""
+import os
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import fx.artifacts
+import fx.routes
+
+NAME = "2022-01-01_2022-03-31-ecb.0123456789abcdef.xlsx"
+DATA = bytes(range(256)) * 4  # 1024 bytes
+MTIME = 1_660_000_000
+
+
+@pytest.fixture
+def client(workdir):
+    p = fx.artifacts.TMP / NAME
+    p.write_bytes(DATA)
+    os.utime(p, (MTIME, MTIME))
+    app = FastAPI()
+    app.include_router(fx.routes.router, prefix="/fx")
+    return TestClient(app)
+
+
+def get(client, **headers):
+    return client.get(f"/fx/dl/{NAME}/", headers=headers)
+
+
+def test_whole_file(client):
+    r = get(client)
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["last-modified"] == formatdate(MTIME, usegmt=True)
+    assert r.headers["etag"]
+
+
+def test_not_found(client):
+    assert client.get("/fx/dl/nope.xlsx/").status_code == 404
+    assert client.get("/fx/dl/.hidden.xlsx/").status_code == 404
+
+
+@pytest.mark.parametrize(
+    "range_, start, end",
+    [
+        ("bytes=0-99", 0, 99),
+        ("bytes=1000-", 1000, 1023),
+        ("bytes=1000-5000", 1000, 1023),  # end past file is clipped
+        ("bytes=-24", 1000, 1023),  # suffix
+        ("bytes=-5000", 0, 1023),  # suffix longer than file
+    ],
+)
+def test_range(client, range_, start, end):
+    r = get(client, range=range_)
+    assert r.status_code == 206
+    assert r.content == DATA[start : end + 1]
+    assert r.headers["content-range"] == f"bytes {start}-{end}/1024"
+    assert r.headers["content-length"] == str(end - start + 1)
+
+
+@pytest.mark.parametrize("range_", ["bytes=1024-", "bytes=5000-6000", "bytes=-0"])
+def test_range_out_of_file(client, range_):
+    r = get(client, range=range_)
+    assert r.status_code == 416
+    assert r.headers["content-range"] == "bytes */1024"
+
+
+@pytest.mark.parametrize(
+    "range_",
+    [
+        "bytes=0-1,5-6",  # multiple ranges
+        "items=0-10",
+        "bytes=abc",
+        "bytes=10-5",
+    ],
+)
+def test_range_ignored(client, range_):
+    r = get(client, range=range_)
+    assert r.status_code == 200
+    assert r.content == DATA
+
+
+def test_if_range(client):
+    etag = get(client).headers["etag"]
+    assert get(client, range="bytes=0-9", **{"if-range": etag}).status_code == 206
+    r = get(client, range="bytes=0-9", **{"if-range": '"old"'})
+    assert r.status_code == 200  # changed meanwhile, start over
+    assert r.content == DATA
+
+
+def test_if_none_match(client):
+    etag = get(client).headers["etag"]
+    for value in (etag, f'"other", {etag}', "*"):
+        r = get(client, **{"if-none-match": value})
+        assert r.status_code == 304
+        assert r.headers["etag"] == etag
+        assert not r.content
+    assert get(client, **{"if-none-match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client):
+    ims = "if-modified-since"
+    assert get(client, **{ims: formatdate(MTIME, usegmt=True)}).status_code == 304
+    assert get(client, **{ims: formatdate(MTIME + 60, usegmt=True)}).status_code == 304
+    assert get(client, **{ims: formatdate(MTIME - 60, usegmt=True)}).status_code == 200
+    assert get(client, **{ims: "yesterday"}).status_code == 200
+
+
+def test_if_none_match_wins(client):
+    # If-Modified-Since is ignored when If-None-Match is there
+    r = get(
+        client,
+        **{
+            "if-none-match": '"other"',
+            "if-modified-since": formatdate(MTIME, usegmt=True),
+        },
+    )
+    assert r.status_code == 200
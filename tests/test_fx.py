@@ -0,0 +1,50 @@
+"""Upstream responses that are errors in disguise never count as fetched."""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import crud.fx
+import crud.http
+import crud.store
+
+
+def upstream(monkeypatch, body: dict) -> None:
+    """Every upstream call answers HTTP 200 with `body`."""
+    client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json=body))
+    )
+    monkeypatch.setattr(crud.http, "_client", client)
+    monkeypatch.setattr(crud.http, "_pid", crud.http.os.getpid())
+
+
+def test_parse_apilayer_error_body():
+    error = {"success": False, "error": {"code": 104, "type": "usage_limit_reached"}}
+    with pytest.raises(crud.http.UpstreamError, match="usage_limit_reached"):
+        crud.fx.parse_apilayer(json.dumps(error))
+    with pytest.raises(crud.http.UpstreamError):
+        crud.fx.parse_apilayer(json.dumps({"message": "Invalid authentication"}))
+
+
+def test_parse_apilayer_no_rates():
+    df = crud.fx.parse_apilayer(json.dumps({"success": True, "rates": {}}))
+    assert df.empty
+    assert list(df.columns) == crud.store.COLS
+
+
+def test_apilayer_error_body_not_covered(workdir, monkeypatch):
+    upstream(monkeypatch, {"success": False, "error": {"code": 101}})
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(crud.fx.get_apilayer("2022-01-01", "2022-01-31", ["RSD"]))
+    assert exc.value.status_code == 502
+    assert crud.store.covered("apilayer", "RSD", "D") == []
+
+
+def test_investiny_no_data(workdir, monkeypatch):
+    upstream(monkeypatch, {"s": "no_data"})
+    with pytest.raises(crud.http.UpstreamError, match="no_data"):
+        asyncio.run(
+            crud.fx.investiny_historical_data(1, "01/01/2022", "03/31/2022", "M")
+        )
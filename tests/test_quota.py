@@ -0,0 +1,27 @@
+"""`crud.quota.get` reads the cache once per QUOTA_REFRESH_S, hit or miss."""
+import crud.cache
+import crud.quota
+from config import settings
+
+
+def test_miss_is_kept(workdir, monkeypatch):
+    reads = []
+    get = crud.cache.get
+    monkeypatch.setattr(crud.cache, "get", lambda key: reads.append(key) or get(key))
+    monkeypatch.setattr(settings, "QUOTA_REFRESH_S", 60)
+
+    assert crud.quota.get() is None
+    assert crud.quota.get() is None
+    assert len(reads) == 1
+
+    clock = crud.quota.time.monotonic() + 61
+    monkeypatch.setattr(crud.quota.time, "monotonic", lambda: clock)
+    crud.cache.create(key=crud.quota.KEY, obj={"remaining": 5, "limit": 10})
+    assert crud.quota.get() == {"remaining": 5, "limit": 10}
+    assert len(reads) == 2
+
+
+def test_update_is_seen_at_once(workdir):
+    assert crud.quota.get() is None
+    crud.quota.update({"remaining": 1, "limit": 2})
+    assert crud.quota.get() == {"remaining": 1, "limit": 2}
@@ -0,0 +1,89 @@
+"""
+`crud.router.route`: each (currency, freq) is served by its owner, whatever is
+in store, stand-ins only while the owner is out of question.
+"""
+import math
+
+import pytest
+
+import crud.router
+import crud.store
+from config import settings
+
+DATE_FROM, DATE_TO = "2022-01-01", "2022-03-31"
+ALL = ["ecb", "apilayer", "investiny"]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Store covering the sources in the returned set (everything), others nothing."""
+    full: set[str] = set()
+    monkeypatch.setattr(
+        crud.store,
+        "covered",
+        lambda source, currency, freq: [("2000-01-01", "2099-12-31")]
+        if source in full
+        else [],
+    )
+    return full
+
+
+@pytest.fixture
+def down(monkeypatch):
+    """Sources in the returned set are out of question (open breaker)."""
+    out: set[str] = set()
+    monkeypatch.setattr(
+        crud.router, "call_cost", lambda source: math.inf if source in out else 1.0
+    )
+    return out
+
+
+def served(routes, freq: str) -> dict[str, set[str]]:
+    """currency -> sources serving its `freq` cells."""
+    out: dict[str, set[str]] = {}
+    for source, cells in routes.items():
+        for currency, freq_, _ in cells:
+            if freq_ == freq:
+                out.setdefault(currency, set()).add(source)
+    return out
+
+
+def test_same_routes_whatever_is_stored(store, down):
+    fresh = crud.router.route(DATE_FROM, DATE_TO, ALL)
+    for source in ("investiny", "apilayer", "ecb"):
+        store.add(source)
+        assert crud.router.route(DATE_FROM, DATE_TO, ALL) == fresh
+
+
+def test_monthly_owner_by_priority(store, down):
+    routes = crud.router.route(DATE_FROM, DATE_TO, ALL)
+    monthly = served(routes, "M")
+    for currency in settings.APILAYER_SYMBOLS.split(","):
+        assert monthly[currency] == {"investiny"}  # close, not apilayer average
+    for currency in settings.ECB_SYMBOLS.split("+"):
+        assert monthly[currency] == {"ecb"}
+
+
+def test_apilayer_alone_derives_monthly(store, down):
+    routes = crud.router.route(DATE_FROM, DATE_TO, ["apilayer"])
+    assert set(served(routes, "M")) == set(settings.APILAYER_SYMBOLS.split(","))
+
+
+def test_stand_in_while_owner_is_down(store, down):
+    down.add("ecb")
+    routes = crud.router.route(DATE_FROM, DATE_TO, ALL)
+    for currency in settings.ECB_SYMBOLS.split("+"):
+        assert served(routes, "D")[currency] == {"apilayer"}
+        assert served(routes, "M")[currency] == {"apilayer"}  # average for average
+
+
+def test_no_stand_in_of_other_meaning(store, down):
+    down.add("investiny")
+    routes = crud.router.route(DATE_FROM, DATE_TO, ALL)
+    for currency in settings.APILAYER_SYMBOLS.split(","):
+        assert served(routes, "M")[currency] == {"investiny"}  # stale store, if any
+
+
+def test_meaning():
+    assert crud.router.meaning("ecb", "M") == crud.router.meaning("apilayer", "M")
+    assert crud.router.meaning("investiny", "M") != crud.router.meaning("ecb", "M")
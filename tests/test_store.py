@@ -0,0 +1,146 @@
+"""Span arithmetic of `crud.store`: what is covered, what has to be fetched."""
+import pandas as pd
+import pytest
+
+import crud.store
+from config import settings
+
+JAN_MAR = ("2022-01-01", "2022-03-31")
+
+
+@pytest.mark.parametrize(
+    "spans, merged",
+    [
+        ([], []),
+        ([("2022-01-01", "2022-01-31")], [("2022-01-01", "2022-01-31")]),
+        # adjacent
+        (
+            [("2022-01-01", "2022-01-31"), ("2022-02-01", "2022-02-28")],
+            [("2022-01-01", "2022-02-28")],
+        ),
+        # overlapping, unsorted
+        (
+            [("2022-01-15", "2022-02-28"), ("2022-01-01", "2022-01-31")],
+            [("2022-01-01", "2022-02-28")],
+        ),
+        # contained
+        (
+            [("2022-01-01", "2022-03-31"), ("2022-02-01", "2022-02-28")],
+            [("2022-01-01", "2022-03-31")],
+        ),
+        # one day apart is a gap
+        (
+            [("2022-01-01", "2022-01-30"), ("2022-02-01", "2022-02-28")],
+            [("2022-01-01", "2022-01-30"), ("2022-02-01", "2022-02-28")],
+        ),
+    ],
+)
+def test_merge(spans, merged):
+    assert crud.store.merge(spans) == merged
+
+
+@pytest.mark.parametrize(
+    "covered, gaps",
+    [
+        ([], [("2022-01-01", "2022-03-31")]),
+        ([("2021-01-01", "2022-12-31")], []),
+        # gap at start
+        ([("2022-02-01", "2022-03-31")], [("2022-01-01", "2022-01-31")]),
+        # gap at end
+        ([("2021-12-01", "2022-02-28")], [("2022-03-01", "2022-03-31")]),
+        # gap in the middle, covered in pieces
+        (
+            [("2022-01-01", "2022-01-31"), ("2022-03-01", "2022-03-10")],
+            [("2022-02-01", "2022-02-28"), ("2022-03-11", "2022-03-31")],
+        ),
+        # covered outside of span only
+        (
+            [("2021-01-01", "2021-12-31"), ("2022-04-01", "2022-04-30")],
+            [("2022-01-01", "2022-03-31")],
+        ),
+    ],
+)
+def test_subtract(covered, gaps):
+    assert crud.store.subtract(("2022-01-01", "2022-03-31"), covered) == gaps
+
+
+def fetched(source, currencies, freqs, span, rows=()):
+    df = pd.DataFrame(list(rows), columns=crud.store.COLS)
+    crud.store.save(df, source, currencies, freqs, span)
+
+
+@pytest.fixture
+def closed(workdir, monkeypatch):
+    """Months up to 2022-03 are closed."""
+    monkeypatch.setattr(crud.store, "closed_until", lambda: "2022-03-31")
+
+
+def test_mark_merges_closed(closed):
+    fetched("ecb", ["USD"], ["D"], ("2022-01-01", "2022-01-31"))
+    fetched("ecb", ["USD"], ["D"], ("2022-02-01", "2022-02-28"))
+    fetched("ecb", ["USD"], ["D"], ("2022-01-15", "2022-03-15"))
+    assert crud.store.covered("ecb", "USD", "D") == [("2022-01-01", "2022-03-15")]
+    assert crud.store.covered("ecb", "USD", "M") == []
+    assert crud.store.covered("ecb", "CZK", "D") == []
+
+
+def test_open_month_expires(closed, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_TTL_OPEN_S", 60)
+    fetched("ecb", ["USD"], ["D"], ("2022-03-01", "2022-04-20"))
+    assert crud.store.covered("ecb", "USD", "D") == [("2022-03-01", "2022-04-20")]
+
+    later = crud.store.time.time() + 61
+    monkeypatch.setattr(crud.store.time, "time", lambda: later)
+    assert crud.store.covered("ecb", "USD", "D") == [("2022-03-01", "2022-03-31")]
+    assert crud.store.plan("ecb", ["USD"], ["D"], "2022-03-01", "2022-04-20") == [
+        (("USD",), ("2022-04-01", "2022-04-20"))
+    ]
+
+
+def test_expire_open(closed):
+    fetched("ecb", ["USD"], ["D"], ("2022-03-01", "2022-04-20"))
+    crud.store.expire_open("ecb")
+    assert crud.store.covered("ecb", "USD", "D") == [("2022-03-01", "2022-03-31")]
+
+
+def test_plan_nothing_to_do(closed):
+    fetched("ecb", ["USD", "CZK"], ["D", "M"], JAN_MAR)
+    assert crud.store.plan("ecb", ["USD", "CZK"], ["D", "M"], *JAN_MAR) == []
+
+
+def test_plan_merges_gaps_of_currencies(closed):
+    fetched("ecb", ["USD"], ["D"], ("2022-01-01", "2022-01-31"))
+    fetched("ecb", ["CZK"], ["D"], ("2022-02-01", "2022-02-28"))
+    # USD misses Feb-Mar, CZK Jan and Mar: one call for all of it
+    assert crud.store.plan("ecb", ["USD", "CZK"], ["D"], *JAN_MAR) == [
+        (("USD", "CZK"), JAN_MAR)
+    ]
+
+
+def test_plan_separate_gaps(closed):
+    fetched("ecb", ["USD", "CZK"], ["D"], ("2022-02-01", "2022-02-28"))
+    fetched("ecb", ["USD"], ["D"], ("2022-03-01", "2022-03-31"))
+    assert crud.store.plan("ecb", ["USD", "CZK"], ["D"], *JAN_MAR) == [
+        (("USD", "CZK"), ("2022-01-01", "2022-01-31")),
+        (("CZK",), ("2022-03-01", "2022-03-31")),
+    ]
+
+
+def test_plan_any_freq_missing(closed):
+    fetched("ecb", ["USD"], ["D"], JAN_MAR)
+    assert crud.store.plan("ecb", ["USD"], ["D", "M"], *JAN_MAR) == [
+        (("USD",), JAN_MAR)
+    ]
+
+
+def test_load_what_was_saved(closed):
+    rows = [
+        ("USD", "D", "2022-01-03", 1.13, "ecb"),
+        ("USD", "D", "2022-01-04", 1.12, "ecb"),
+        ("CZK", "D", "2022-01-03", 24.1, "ecb"),
+    ]
+    fetched("ecb", ["USD", "CZK"], ["D"], ("2022-01-01", "2022-01-31"), rows)
+    df = crud.store.load("ecb", ["USD"], ["D"], "2022-01-04", "2022-01-31")
+    assert df.loc[:, ["currency", "ts", "value"]].values.tolist() == [
+        ["USD", "2022-01-04", 1.12]
+    ]
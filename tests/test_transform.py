@@ -0,0 +1,98 @@
+"""
+`fx.forms.transform` gives the same frames as the original row-wise one
+(frozen below), on data of all three sources.
+"""
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import crud.fx
+import fx.forms
+from bench import payloads
+
+
+def transform_orig(
+    df: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """`fx.forms.transform` before vectorization, do not touch."""
+
+    COLS = ["currency", "ts", "value", "source"]
+    emtpy_df = pd.DataFrame(columns=COLS)
+
+    df_daily = df.copy().query("freq == 'D'")
+    if not df_daily.empty:
+        df_daily = df_daily.sort_values(["currency", "ts"]).loc[:, COLS]
+    else:
+        df_daily = emtpy_df.copy()
+
+    df_monthly = df.copy().query("freq == 'M'")
+    if not df_monthly.empty:
+        df_monthly = df_monthly.sort_values(["currency", "ts"]).loc[:, COLS]
+    else:
+        df_monthly = emtpy_df.copy()
+
+    df_spot = df.copy().query("freq == 'D'")
+    if not df_spot.empty:
+        df_spot.loc[:, "_dt"] = pd.to_datetime(df_spot.loc[:, "ts"]).values
+        df_spot.loc[:, "_ym"] = df_spot.apply(
+            lambda row: f'{row["currency"]}-{row["_dt"].year}-{row["_dt"].month}',
+            axis=1,
+        )
+        df_spot = (
+            df_spot.sort_values("ts", ascending=False)
+            .drop_duplicates(keep="first", subset="_ym")
+            .sort_values(["currency", "ts"])
+            .loc[:, COLS]
+        )
+        for col in df_spot.columns:
+            if col.startswith("_"):
+                del df_spot[col]
+    else:
+        # return empty DF in correct shape
+        df_spot = emtpy_df.copy()
+
+    return df_daily, df_spot, df_monthly
+
+
+def rates(months: int, sources: tuple[str, ...]) -> pd.DataFrame:
+    """Normalized DF like `crud.fx.get_all` gives, each source own currencies."""
+    date_from, date_to = payloads.span(months)
+    ecb, apilayer, investiny = (
+        payloads.currencies(12)[:4],
+        payloads.currencies(12)[4:8],
+        payloads.currencies(12)[8:],
+    )
+    frames = [pd.DataFrame(columns=["ts", "currency", "value", "freq", "source"])]
+    if "ecb" in sources:
+        frames.append(crud.fx.parse_ecb(payloads.ecb_csv(ecb, date_from, date_to)))
+    if "apilayer" in sources:
+        frames.append(
+            crud.fx.parse_apilayer(payloads.apilayer_json(apilayer, date_from, date_to))
+        )
+    if "investiny" in sources:
+        frames += [
+            crud.fx.parse_investiny(
+                payloads.investiny_history(c, date_from, date_to), c, date_from, date_to
+            )
+            for c in investiny
+        ]
+    return pd.concat(frames)
+
+
+@pytest.mark.parametrize(
+    "months, sources",
+    [
+        (1, ("ecb", "apilayer", "investiny")),
+        (14, ("ecb", "apilayer", "investiny")),
+        (14, ("ecb", "apilayer")),  # daily + ECB monthly
+        (6, ("apilayer",)),  # daily only
+        (6, ("investiny",)),  # monthly only
+        (6, ()),
+    ],
+)
+def test_same_as_orig(months: int, sources: tuple[str, ...]) -> None:
+    df = rates(months, sources)
+    for name, got, expected in zip(
+        ("daily", "spot", "monthly"), fx.forms.transform(df), transform_orig(df)
+    ):
+        assert_frame_equal(got, expected, obj=name)
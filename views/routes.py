@@ -1,18 +1,22 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import random
+from pathlib import Path
 from typing import Literal
 from typing import TypedDict
 
-import pendulum
 import structlog
 from fastapi import APIRouter
 from fastapi import Request
+from fastapi import Response
+from fastapi import status
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 import config
-import crud.cache
+import crud.quota
 from config import settings
 
 log = structlog.get_logger()
@@ -26,10 +30,12 @@ class Checkboxes(TypedDict):
     investiny: bool
 
 
-@router.get("/", response_class=HTMLResponse)
-async def index_view(request: Request):
+@functools.lru_cache(maxsize=2)
+def static_context(day: str) -> dict:
+    """Parts of index context that change once per day at most."""
+    import pendulum
 
-    now = pendulum.now().end_of("month")
+    now = pendulum.from_format(day, "YYYY-MM-DD").end_of("month")
     start = now.subtract(years=3)
     options = []
 
@@ -38,6 +44,45 @@ async def index_view(request: Request):
         options.append(cur.format("YYYY-MM"))
         cur = cur.add(months=1)
 
+    return {
+        "fx_ecb": config.list_rates(settings.ECB_SYMBOLS, sep="+"),
+        "fx_apilayer": config.list_rates(settings.APILAYER_SYMBOLS, sep=","),
+        "fx_investiny": ", ".join(tuple(settings.INVESTINY_SYMBOLS.keys())),
+        "options": list(reversed(options)),
+        "pairs": settings.CROSS_PAIRS,
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def version() -> str:
+    """
+    Hash of templates and settings, pages look different after a deploy changing
+    them, so their ETags must too. Same in all workers (unlike a boot id).
+    """
+    sha = hashlib.sha1(settings.json(exclude={"TELEGRAM_BOT_TOKEN"}).encode())
+    for path in sorted(Path("templates").rglob("*.jinja")):
+        sha.update(path.read_bytes())
+    return sha.hexdigest()[:16]
+
+
+def etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:16] + '"'
+
+
+def not_modified(request: Request, etag_: str) -> Response | None:
+    """304 if client has this version already (If-None-Match)."""
+    headers = {"ETag": etag_, "Cache-Control": "private, no-cache"}
+    if etag_ in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+@router.get("/", response_class=HTMLResponse)
+async def index_view(request: Request):
+    import pendulum
+
+    day = pendulum.now().format("YYYY-MM-DD")
+
     # if no cookie, enable all
     session: Checkboxes
     default = {k: True for k in Checkboxes.__annotations__.keys()}
@@ -48,16 +93,21 @@ async def index_view(request: Request):
             session = default | session  # use what we have, if usable
     request.session.update({"checkboxes": session})
 
+    tag = etag(version(), day, str(request.base_url), sorted(session.items()))
+    if response := not_modified(request, tag):
+        return response
+
     context = {
         "request": request,
-        "fx_ecb": config.list_rates(settings.ECB_SYMBOLS, sep="+"),
-        "fx_apilayer": config.list_rates(settings.APILAYER_SYMBOLS, sep=","),
-        "fx_investiny": ", ".join(tuple(settings.INVESTINY_SYMBOLS.keys())),
-        "options": list(reversed(options)),
+        **static_context(day),
         "checkboxes": session,  # settings from last time
     }
 
-    return templates.TemplateResponse("index/index.jinja", context=context)
+    return templates.TemplateResponse(
+        "index/index.jinja",
+        context=context,
+        headers={"ETag": tag, "Cache-Control": "private, no-cache"},
+    )
 
 
 @router.get("/quota_progressbar/", response_class=HTMLResponse)
@@ -65,7 +115,7 @@ async def hx_quota_progressbar(request: Request):
 
     APILAYER_DEFAULT_MAX = 250
 
-    dic: dict | None = crud.cache.get("apilayer_quota")
+    dic: dict | None = crud.quota.get()
     if not dic:
         # just first run, before cache is populated
         dic = {
@@ -76,6 +126,10 @@ async def hx_quota_progressbar(request: Request):
     valuenow = dic["remaining"]
     valuemax = dic.get("limit", APILAYER_DEFAULT_MAX)
 
+    tag = etag(valuenow, valuemax)
+    if response := not_modified(request, tag):
+        return response
+
     if valuemax > 0:
         width: int = int(valuenow / valuemax * 100)
     else:
@@ -90,7 +144,11 @@ async def hx_quota_progressbar(request: Request):
         "width": width,
         "label": label,
     }
-    return templates.TemplateResponse(name="index/quota.jinja", context=context)
+    return templates.TemplateResponse(
+        name="index/quota.jinja",
+        context=context,
+        headers={"ETag": tag, "Cache-Control": "private, no-cache"},
+    )
 
 
 @router.get("/toggle_checkbox/{key}")